@@ -0,0 +1,201 @@
+"""
+Animation
+
+Picks the animation clip and frame for every animated character from its
+physics state. Which clip plays for which state is data in ANIMATION_CLIPS,
+and the state of all actors (clip, time in clip, facing) is kept in NumPy
+arrays so one update picks the frames for every actor at once. A sprite's
+texture is only set when its frame actually changes, and frames advance by
+the delta_time handed to update() rather than once per call.
+
+Clips come from the packed sheet in sprite_atlas.py, so switching frames
+never loads a texture.
+"""
+
+# type: ignore
+import numpy as np
+
+from world import BASE_TICK_RATE, PLAYER_MOVEMENT_SPEED
+
+# Constants
+# State name, clip in the sprite sheet, frames per second, whether it loops
+# Order matters, the index of a row is the state id used in the arrays
+ANIMATION_CLIPS = (
+    ("Idle", "Idle", 6, True),
+    ("Walk", "Walk", 10, True),
+    ("Run", "Run", 12, True),
+    ("Jump", "Jump", 12, False),
+    ("Climb", "Climb", 8, True),
+    ("Hurt", "Hurt", 10, False),
+    ("Death", "Death", 8, False),
+)
+
+STATE_IDS = {name: index for index, (name, _, _, _) in enumerate(ANIMATION_CLIPS)}
+
+IDLE = STATE_IDS["Idle"]
+WALK = STATE_IDS["Walk"]
+RUN = STATE_IDS["Run"]
+JUMP = STATE_IDS["Jump"]
+CLIMB = STATE_IDS["Climb"]
+HURT = STATE_IDS["Hurt"]
+DEATH = STATE_IDS["Death"]
+
+# Horizontal speeds in pixels per second where standing turns into walking and walking into running
+# The player moves at PLAYER_MOVEMENT_SPEED per step at BASE_TICK_RATE so it walks, anything faster runs
+WALK_SPEED = 0.5 * BASE_TICK_RATE
+RUN_SPEED = (PLAYER_MOVEMENT_SPEED + 1) * BASE_TICK_RATE
+
+# No state forced by trigger()
+NO_TRIGGER = -1
+
+
+class AnimationSystem:
+    """
+    Animation state of many sprites, updated together.
+    """
+
+    def __init__(self, atlas, timestep=1 / BASE_TICK_RATE):
+
+        self.atlas = atlas
+
+        # Seconds of game time one world step covers, change_x is in pixels per step
+        self.timestep = timestep
+
+        # One flat list of textures, right facing frames first then the mirrored ones
+        # clip_offsets[character][state] is where a clip starts in it
+        self.textures = []
+        self.clip_offsets = {}
+        for character in atlas.animations:
+            offsets = []
+            for _, clip, _, _ in ANIMATION_CLIPS:
+                offsets.append(len(self.textures))
+                self.textures.extend(atlas.frames(character, clip))
+            self.clip_offsets[character] = offsets
+        self.mirror_offset = len(self.textures)
+        for character in atlas.animations:
+            for _, clip, _, _ in ANIMATION_CLIPS:
+                self.textures.extend(atlas.frames(character, clip, mirrored=True))
+
+        # Per state lookups used by the vectorized update
+        self.frames_per_second = np.array([fps for _, _, fps, _ in ANIMATION_CLIPS], dtype=np.float64)
+        self.loops = np.array([loops for _, _, _, loops in ANIMATION_CLIPS], dtype=bool)
+        # Every monster has the same frame count per clip, the first one's counts are used
+        first_character = next(iter(atlas.animations))
+        self.frame_counts = np.array([len(atlas.frames(first_character, clip)) for _, clip, _, _ in ANIMATION_CLIPS], dtype=np.int64)
+
+        self.sprites = []
+
+        # Per actor arrays, all the same length as self.sprites
+        self.offsets = np.zeros((0, len(ANIMATION_CLIPS)), dtype=np.int64)
+        self.state = np.zeros(0, dtype=np.int64)
+        self.time = np.zeros(0, dtype=np.float64)
+        self.facing_left = np.zeros(0, dtype=bool)
+        self.triggered = np.zeros(0, dtype=np.int64)
+        # Frame each actor is on, and the frame its sprite shows, which lags behind while it is not visible
+        self.frame_index = np.zeros(0, dtype=np.int64)
+        self.texture_index = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.sprites)
+
+    def add(self, sprite, character):
+        """Start animating a sprite with one of the atlas characters, returns its actor index"""
+
+        index = len(self.sprites)
+        self.sprites.append(sprite)
+
+        offsets = self.clip_offsets[character]
+        self.offsets = np.vstack([self.offsets, np.array(offsets, dtype=np.int64)])
+        self.state = np.append(self.state, IDLE)
+        self.time = np.append(self.time, 0.0)
+        self.facing_left = np.append(self.facing_left, False)
+        self.triggered = np.append(self.triggered, NO_TRIGGER)
+
+        # The first idle frame is shown right away
+        self.frame_index = np.append(self.frame_index, offsets[IDLE])
+        self.texture_index = np.append(self.texture_index, offsets[IDLE])
+        sprite.texture = self.textures[offsets[IDLE]]
+        return index
+
+    def clear(self):
+        """Stop animating every sprite"""
+        self.sprites = []
+        self.offsets = self.offsets[:0]
+        self.state = self.state[:0]
+        self.time = self.time[:0]
+        self.facing_left = self.facing_left[:0]
+        self.triggered = self.triggered[:0]
+        self.frame_index = self.frame_index[:0]
+        self.texture_index = self.texture_index[:0]
+
+    def trigger(self, index, state):
+        """
+        Play a state no matter what the physics says, for HURT and DEATH.
+        HURT plays once and hands back to the physics state, DEATH holds its last frame.
+        """
+        self.triggered[index] = state
+
+    def update(self, delta_time, on_ground, change_x, change_y, climbing=None, visible=None):
+        """
+        Advance every actor by delta_time. on_ground, change_x, change_y and
+        climbing are arrays with one entry per actor. Returns how many sprites
+        got a new texture.
+
+        With a visible mask only visible actors get their texture set, the
+        others keep their frame in the arrays until show() is called for them.
+        """
+
+        on_ground = np.asarray(on_ground, dtype=bool)
+        change_x = np.asarray(change_x, dtype=np.float64)
+        speed = np.abs(change_x) / self.timestep
+
+        # Physics state to clip, a triggered state wins over all of them
+        state = np.where(speed >= RUN_SPEED, RUN, np.where(speed >= WALK_SPEED, WALK, IDLE))
+        # Rising counts as a jump even on the frame the jump starts and the feet still touch the ground
+        state = np.where(on_ground & (np.asarray(change_y, dtype=np.float64) <= 0), state, JUMP)
+        if climbing is not None:
+            state = np.where(np.asarray(climbing, dtype=bool), CLIMB, state)
+        state = np.where(self.triggered != NO_TRIGGER, self.triggered, state)
+
+        # A new clip starts from its first frame
+        self.time = np.where(state != self.state, 0.0, self.time + delta_time)
+        self.state = state
+
+        # Facing only changes while moving sideways
+        self.facing_left = np.where(change_x < 0, True, np.where(change_x > 0, False, self.facing_left))
+
+        frame = (self.time * self.frames_per_second[state]).astype(np.int64)
+        count = self.frame_counts[state]
+        finished = frame >= count
+        frame = np.where(self.loops[state], frame % count, np.minimum(frame, count - 1))
+
+        # Hurt is over once its last frame has played
+        self.triggered = np.where(finished & (self.triggered == HURT), NO_TRIGGER, self.triggered)
+
+        self.frame_index = self.offsets[np.arange(len(state)), state] + frame + self.facing_left * self.mirror_offset
+
+        if visible is None:
+            return self.show(np.arange(len(state)))
+        return self.show(np.flatnonzero(visible))
+
+    def show(self, indices):
+        """Give the sprites of these actors their current frame, returns how many got a new texture"""
+
+        # Only sprites whose frame changed touch arcade
+        indices = np.asarray(indices, dtype=np.int64)
+        changed = indices[self.frame_index[indices] != self.texture_index[indices]]
+        self.texture_index[changed] = self.frame_index[changed]
+        sprites = self.sprites
+        textures = self.textures
+        frame_index = self.frame_index
+        for index in changed.tolist():
+            sprites[index].texture = textures[frame_index[index]]
+        return len(changed)
+
+    def update_sprites(self, delta_time, on_ground, climbing=None):
+        """Same as update() but reads change_x and change_y from the sprites"""
+
+        count = len(self.sprites)
+        change_x = np.fromiter((sprite.change_x for sprite in self.sprites), dtype=np.float64, count=count)
+        change_y = np.fromiter((sprite.change_y for sprite in self.sprites), dtype=np.float64, count=count)
+        return self.update(delta_time, on_ground, change_x, change_y, climbing)
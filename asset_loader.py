@@ -0,0 +1,155 @@
+"""
+Asset Loader
+
+Loads the next level while the current one is being played. Parsing the
+Tiled file, decoding the tileset PNGs, building the sprites and splitting the
+static layers into the chunks the game draws happen on a worker thread with
+lazy sprite lists, so nothing touches OpenGL there. What has to happen on the
+main thread, adding the textures to the GPU atlas and creating the sprite
+list buffers, is broken into small steps and update() runs only as many of
+them as fit in UPLOAD_BUDGET each frame. Only the lists that are drawn are
+uploaded: one step per chunk of a static layer and one per layer drawn whole.
+
+Once a level is ready it sits in the LevelCache, and switching to it is the
+same as a restart: GameWorld.setup() finds it there and loads nothing.
+
+    loader.preload("level_2.json")
+    ...
+    loader.update()  # once per frame
+    if loader.is_ready("level_2.json"):
+        world.map_path = "level_2.json"
+        world.setup()
+"""
+
+# type: ignore
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import arcade
+
+from culling import level_chunked_layers
+from level_cache import build_level
+
+# Constants
+# Main thread time per frame spent on GPU uploads, a quarter of a 60 Hz frame
+UPLOAD_BUDGET = 0.004
+
+
+class PendingLevel:
+    """
+    A level being loaded, and the main thread steps left before it is ready.
+    """
+
+    def __init__(self, map_path, future):
+        self.map_path = map_path
+        self.future = future
+        # The level the worker built and the callables AssetLoader.update() runs one at a time,
+        # both None until the worker is done
+        self.level = None
+        self.steps = None
+
+
+class AssetLoader:
+    """
+    Loads levels and textures on a worker thread and uploads them a little each frame.
+    """
+
+    def __init__(self, level_cache, scaling, layer_options, texture_paths=(), upload_budget=UPLOAD_BUDGET):
+
+        self.level_cache = level_cache
+        self.scaling = scaling
+        self.layer_options = layer_options
+        self.upload_budget = upload_budget
+
+        # Textures every level needs, like the player, loaded along with the first preloaded level
+        self.texture_paths = list(texture_paths)
+
+        # Maps a map path to its PendingLevel, oldest first
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="asset-loader")
+
+        # Counters for tuning the budget
+        self.steps_run = 0
+        self.longest_update = 0.0
+
+    def preload(self, map_path):
+        """Start loading a level in the background, does nothing if it is loaded or loading"""
+
+        if map_path in self.pending or map_path in self.level_cache.levels:
+            return
+        self.pending[map_path] = PendingLevel(map_path, self.executor.submit(self._load, map_path))
+
+    def _load(self, map_path):
+        """Runs on the worker thread, everything here stays off the GPU"""
+
+        level = build_level(map_path, self.scaling, self.layer_options, lazy=True)
+        # Splitting the static layers into chunks only appends to lazy sprite lists
+        level_chunked_layers(level)
+        textures = {path: arcade.load_texture(path) for path in self.texture_paths
+                    if path not in self.level_cache.textures}
+        return level, textures
+
+    def _upload_steps(self, level, textures):
+        """Main thread work left for a loaded level, one texture, chunk, sprite list or static layer per step"""
+
+        ctx = arcade.get_window().ctx
+        atlas = ctx.default_atlas
+
+        steps = deque(lambda texture=texture: atlas.add(texture) for texture in list(textures.values()) + level.textures())
+        # The textures are in the atlas by now, so initializing a list only fills its buffers
+        # Static layers are drawn chunk by chunk and their whole sprite lists never are, so only the chunks are uploaded
+        chunked_layers = level.chunked_layers
+        for name in level.layer_names:
+            if name in chunked_layers:
+                steps.extend(chunk.initialize for chunk in chunked_layers[name].chunks.values())
+            elif name in level.scene:
+                steps.append(level.scene[name].initialize)
+        # Layers kept as arrays are written to the GPU whole, quick even for large layers
+        for layer in level.static_layers.values():
+            steps.append(layer.initialize)
+        return steps
+
+    def update(self):
+        """Run upload steps until this frame's budget is used, call once per frame on the main thread"""
+
+        if not self.pending:
+            return 0
+
+        start = time.perf_counter()
+        steps_run = 0
+        for map_path, pending in list(self.pending.items()):
+            if pending.steps is None:
+                if not pending.future.done():
+                    continue
+                # A failed load raises here, on the main thread, like a failed setup() would
+                level, textures = pending.future.result()
+                for path, texture in textures.items():
+                    self.level_cache.textures.setdefault(path, texture)
+                pending.level = level
+                pending.steps = self._upload_steps(level, textures)
+
+            while pending.steps and time.perf_counter() - start < self.upload_budget:
+                pending.steps.popleft()()
+                steps_run += 1
+
+            if pending.steps:
+                break
+            # Only a fully uploaded level goes in the cache, so setup() never waits on the GPU
+            self.level_cache.add_level(map_path, pending.level)
+            del self.pending[map_path]
+
+        self.steps_run += steps_run
+        self.longest_update = max(self.longest_update, time.perf_counter() - start)
+        return steps_run
+
+    def is_ready(self, map_path):
+        """True once a level can be switched to without loading anything"""
+        return map_path not in self.pending and map_path in self.level_cache.levels
+
+    def close(self):
+        """Stop the worker thread"""
+        for pending in self.pending.values():
+            pending.future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,206 @@
+"""
+Audio
+
+Plays game sounds through a fixed pool of voices. Sounds asked for during a
+tick are queued and started together by update(), so the same sound asked
+for many times in one tick (a run of coins) plays once. Each sound has its
+own limit on how many copies may play at the same time, and when every
+voice is busy a new sound takes the voice of the oldest sound with a lower
+or equal priority, or is dropped if there is none.
+
+NullAudioBackend stands in for the mixer in headless runs. It plays nothing
+but keeps every sound "playing" for as long as the sound lasts, so the voice
+pool fills up, steals and drops the same as it would with a mixer.
+"""
+
+# type: ignore
+import time
+import wave
+
+import arcade
+
+# Constants
+# Sounds that can play at the same time
+MAX_VOICES = 8
+
+# Copies of one sound that can play at the same time unless registered otherwise
+DEFAULT_MAX_CONCURRENT = 2
+
+# Seconds NullAudioBackend keeps a sound playing when it cannot read the file's length
+DEFAULT_SOUND_LENGTH = 0.5
+
+
+class ArcadeAudioBackend:
+    """
+    Plays sounds with arcade.
+    """
+
+    def load(self, path):
+        return arcade.load_sound(path)
+
+    def play(self, sound, volume):
+        return arcade.play_sound(sound, volume=volume)
+
+    def is_playing(self, sound, player):
+        return player is not None and sound.is_playing(player)
+
+    def stop(self, sound, player):
+        if player is not None:
+            arcade.stop_sound(player)
+
+
+class NullAudioBackend:
+    """
+    Plays nothing, a sound counts as playing for its length from when it was started.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        # Seconds from any start, tests hand in their own
+        self.clock = clock
+
+    def load(self, path):
+        """The sound is its length in seconds, read from the header of WAV files"""
+        try:
+            with wave.open(str(arcade.resources.resolve(path)), "rb") as file:
+                return file.getnframes() / file.getframerate()
+        except (OSError, EOFError, wave.Error):
+            return DEFAULT_SOUND_LENGTH
+
+    def play(self, sound, volume):
+        # The player is when the sound will be over
+        return self.clock() + sound
+
+    def is_playing(self, sound, player):
+        return self.clock() < player
+
+    def stop(self, sound, player):
+        pass
+
+
+class SoundSpec:
+    """
+    A registered sound and its playback rules.
+    """
+
+    def __init__(self, sound, priority, max_concurrent, volume):
+        self.sound = sound
+        self.priority = priority
+        self.max_concurrent = max_concurrent
+        self.volume = volume
+
+
+class Voice:
+    """
+    One sound playing in the pool.
+    """
+
+    def __init__(self, name, player, priority, order):
+        self.name = name
+        self.player = player
+        self.priority = priority
+        # Start order, the lowest is the oldest voice
+        self.order = order
+
+
+class SoundManager:
+    """
+    Voice pool with per sound limits, per tick de-duplication and stealing by priority.
+    """
+
+    def __init__(self, backend=None, max_voices=MAX_VOICES):
+
+        self.backend = backend if backend is not None else ArcadeAudioBackend()
+        self.max_voices = max_voices
+
+        # Maps a sound name to its SoundSpec
+        self.sounds = {}
+
+        # Voices started and not yet known to be finished
+        self.voices = []
+
+        # Sound names asked for since the last update, in the order they were first asked for
+        self.queued = {}
+
+        self.started = 0
+
+        # Metrics
+        self.played = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.stolen = 0
+        self.peak_voices = 0
+
+    def register(self, name, path, priority=0, max_concurrent=DEFAULT_MAX_CONCURRENT, volume=1.0):
+        """Load a sound once and give it a name, a priority and a concurrency limit"""
+        self.sounds[name] = SoundSpec(self.backend.load(path), priority, max_concurrent, volume)
+
+    def play(self, name):
+        """Queue a sound for the next update, asking again in the same tick does nothing"""
+
+        if name in self.queued:
+            self.deduplicated += 1
+            return
+        self.queued[name] = None
+
+    def update(self):
+        """Start the queued sounds, call once per tick"""
+
+        # Finished voices give their place back first
+        backend = self.backend
+        self.voices = [voice for voice in self.voices
+                       if backend.is_playing(self.sounds[voice.name].sound, voice.player)]
+
+        if not self.queued:
+            return
+        for name in self.queued:
+            self._start(name)
+        self.queued.clear()
+
+        self.peak_voices = max(self.peak_voices, len(self.voices))
+
+    def _start(self, name):
+
+        spec = self.sounds[name]
+
+        # A sound at its own limit replaces its oldest copy instead of stacking another
+        same = [voice for voice in self.voices if voice.name == name]
+        if len(same) >= spec.max_concurrent:
+            if spec.max_concurrent == 0:
+                self.dropped += 1
+                return
+            self._stop(same[0])
+        elif len(self.voices) >= self.max_voices:
+            # Full pool, the oldest voice with the lowest priority no higher than ours is stolen
+            candidates = [voice for voice in self.voices if voice.priority <= spec.priority]
+            if not candidates:
+                self.dropped += 1
+                return
+            self._stop(min(candidates, key=lambda voice: (voice.priority, voice.order)))
+            self.stolen += 1
+
+        player = self.backend.play(spec.sound, spec.volume)
+        self.voices.append(Voice(name, player, spec.priority, self.started))
+        self.started += 1
+        self.played += 1
+
+    def _stop(self, voice):
+        self.backend.stop(self.sounds[voice.name].sound, voice.player)
+        self.voices.remove(voice)
+
+    def stop_all(self):
+        """Silence every voice and forget queued sounds, for a restart"""
+
+        for voice in list(self.voices):
+            self._stop(voice)
+        self.queued.clear()
+
+    def metrics(self):
+        """Voice counts and how many requests were merged, dropped or stole a voice"""
+        return {
+            "voices": len(self.voices),
+            "peak_voices": self.peak_voices,
+            "played": self.played,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "stolen": self.stolen,
+        }
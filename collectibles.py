@@ -0,0 +1,160 @@
+"""
+Collectibles
+
+Static grid index over pickup layers such as "Coins". Pickups never move, so
+the grid is built once when the level loads and the player is only tested
+against the items in the cells it overlaps instead of every item on the layer.
+Collected items are taken out of the grid as they are picked up, and a bool
+array in map order records which of the layer's pickups are gone, so a
+snapshot can copy the whole layer's state at once.
+
+A layer becomes a collectible layer through the same layer_options dict that
+is passed to arcade.load_tilemap():
+
+    layer_options = {
+        "Coins": {
+            "collectible": True,
+            "collectible_cell_size": 128,
+        }
+    }
+
+arcade ignores option keys it does not know about, so both maps can share it.
+"""
+
+# type: ignore
+import math
+
+import arcade
+import numpy as np
+
+# Constants
+DEFAULT_CELL_SIZE = 128
+
+
+class CollectibleIndex:
+    """
+    Uniform grid of the sprites on one pickup layer.
+    """
+
+    def __init__(self, sprite_list, cell_size=DEFAULT_CELL_SIZE):
+
+        self.sprite_list = sprite_list
+        self.cell_size = cell_size
+
+        # Maps (column, row) to the sprites touching that cell
+        self.cells = {}
+
+        # Maps a sprite to the cells it was put in so removing it is cheap
+        self.sprite_cells = {}
+
+        # Map order position of every pickup the layer started with, and which of them are gone
+        # Pickups added later, like a streamed chunk's, are indexed but not tracked here
+        self.order = {sprite: position for position, sprite in enumerate(sprite_list)}
+        self.removed = np.zeros(len(self.order), dtype=bool)
+
+        for sprite in sprite_list:
+            self.add(sprite)
+
+    def __len__(self):
+        return len(self.sprite_cells)
+
+    def _cells_for(self, left, right, bottom, top):
+        """All grid cells overlapping a box"""
+
+        size = self.cell_size
+        min_column = math.floor(left / size)
+        max_column = math.floor(right / size)
+        min_row = math.floor(bottom / size)
+        max_row = math.floor(top / size)
+
+        return [(column, row)
+                for column in range(min_column, max_column + 1)
+                for row in range(min_row, max_row + 1)]
+
+    def add(self, sprite):
+        """Put a sprite in every cell its box touches"""
+
+        cells = self._cells_for(sprite.left, sprite.right, sprite.bottom, sprite.top)
+        for cell in cells:
+            self.cells.setdefault(cell, []).append(sprite)
+        self.sprite_cells[sprite] = cells
+
+        position = self.order.get(sprite)
+        if position is not None:
+            self.removed[position] = False
+
+    def remove(self, sprite):
+        """Take a sprite out of the grid, does nothing if it is not in it"""
+
+        cells = self.sprite_cells.pop(sprite, None)
+        if cells is None:
+            return
+
+        position = self.order.get(sprite)
+        if position is not None:
+            self.removed[position] = True
+
+        for cell in cells:
+            bucket = self.cells[cell]
+            bucket.remove(sprite)
+            # Empty cells are dropped so the dict only holds cells with pickups
+            if not bucket:
+                del self.cells[cell]
+
+    def check_for_collision(self, sprite):
+        """Return the indexed sprites touching sprite, only looking in the cells it overlaps"""
+
+        candidates = []
+        seen = set()
+        for cell in self._cells_for(sprite.left, sprite.right, sprite.bottom, sprite.top):
+            for other in self.cells.get(cell, ()):
+                # A pickup spanning several cells is only tested once
+                if other not in seen:
+                    seen.add(other)
+                    candidates.append(other)
+
+        return [other for other in candidates if arcade.check_for_collision(sprite, other)]
+
+    def collect(self, sprite):
+        """Remove every pickup sprite touches from the grid and the scene and return them"""
+
+        hit_list = self.check_for_collision(sprite)
+        for item in hit_list:
+            self.remove(item)
+            item.remove_from_sprite_lists()
+        return hit_list
+
+    def collect_boxes(self, boxes):
+        """
+        Remove and return every pickup touching any of a list of (left, right,
+        bottom, top) boxes, for a player whose whole path through a tick counts.
+        """
+
+        hit_list = []
+        for left, right, bottom, top in boxes:
+            for cell in self._cells_for(left, right, bottom, top):
+                for other in self.cells.get(cell, ()):
+                    if other in hit_list:
+                        continue
+                    if other.left < right and other.right > left and other.bottom < top and other.top > bottom:
+                        hit_list.append(other)
+
+        for item in hit_list:
+            self.remove(item)
+            item.remove_from_sprite_lists()
+        return hit_list
+
+
+def build_collectibles(scene, layer_options):
+    """Build a CollectibleIndex for every layer marked collectible in layer_options"""
+
+    collectibles = {}
+    for name, options in layer_options.items():
+        if not options.get("collectible"):
+            continue
+        # Maps without this layer simply have nothing to collect on it
+        if name not in scene:
+            continue
+        cell_size = options.get("collectible_cell_size", DEFAULT_CELL_SIZE)
+        collectibles[name] = CollectibleIndex(scene[name], cell_size)
+    return collectibles
@@ -0,0 +1,162 @@
+"""
+Culling
+
+Draws only the parts of the map the camera can see. Static tilemap layers are
+split into square chunks, each with its own SpriteList, and a frame draws the
+chunks that overlap the camera's view. Which chunks those are is only worked
+out again when the camera moves into a different chunk, so the cost of a
+frame depends on the screen size instead of the map size.
+
+Layers that change during play (coins, the player, enemies) are drawn whole.
+Layers already kept as StaticLayer arrays cull themselves the same way and
+are drawn through their own update_visible() and draw().
+
+The chunks of a level are built once by level_chunked_layers() and kept on
+the level. Their sprite lists are lazy, so the asset loader can build them on
+its worker thread and initialize them one chunk at a time on the main thread.
+"""
+
+# type: ignore
+import math
+
+import arcade
+
+# Constants
+# Width and height of a chunk in pixels, 8 by 8 tiles of 64 pixels
+CHUNK_SIZE = 512
+
+
+class ChunkedLayer:
+    """
+    One static layer split into chunk sprite lists.
+    """
+
+    def __init__(self, sprite_list, chunk_size=CHUNK_SIZE):
+
+        self.sprite_list = sprite_list
+        self.chunk_size = chunk_size
+
+        # Maps (column, row) to the SpriteList of the sprites whose center is in that chunk
+        self.chunks = {}
+        for sprite in sprite_list:
+            key = (math.floor(sprite.center_x / chunk_size), math.floor(sprite.center_y / chunk_size))
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                chunk = arcade.SpriteList(lazy=True)
+                self.chunks[key] = chunk
+            chunk.append(sprite)
+
+        # A sprite reaches into the neighbouring chunk by up to half its size,
+        # the view is grown by that much so no overhanging sprite is culled early
+        self.margin = max((max(sprite.width, sprite.height) / 2 for sprite in sprite_list), default=0)
+
+        # Chunk range the visible list was worked out for and the chunks in it
+        self.visible_range = None
+        self.visible_chunks = []
+
+    @property
+    def visible(self):
+        return self.sprite_list.visible
+
+    def update_visible(self, left, bottom, right, top):
+        """Work out the chunks overlapping a rectangle, only when it covers a different chunk range"""
+
+        size = self.chunk_size
+        margin = self.margin
+        chunk_range = (math.floor((left - margin) / size), math.floor((bottom - margin) / size),
+                       math.floor((right + margin) / size), math.floor((top + margin) / size))
+        if chunk_range == self.visible_range:
+            return False
+
+        min_column, min_row, max_column, max_row = chunk_range
+        self.visible_range = chunk_range
+        self.visible_chunks = [chunk for (column, row), chunk in self.chunks.items()
+                               if min_column <= column <= max_column and min_row <= row <= max_row]
+        return True
+
+    def draw(self):
+        """Draw the visible chunks and return how many sprites they hold"""
+
+        sprites = 0
+        for chunk in self.visible_chunks:
+            chunk.draw()
+            sprites += len(chunk)
+        return sprites
+
+
+def level_chunked_layers(level, chunk_size=CHUNK_SIZE):
+    """
+    A ChunkedLayer for every tile layer of a level that does not change during
+    play, built the first time and kept on the level for restarts.
+    """
+
+    chunked_layers = getattr(level, "chunked_layers", None)
+    if chunked_layers is None:
+        # Streamed levels change their layers as chunks come and go, and only hold what is near anyway
+        if level.streamed:
+            chunked_layers = {}
+        else:
+            chunked_layers = {name: ChunkedLayer(level.scene[name], chunk_size) for name in level.layer_names
+                              if name in level.scene and name not in level.collectibles}
+        level.chunked_layers = chunked_layers
+    return chunked_layers
+
+
+class CulledSceneRenderer:
+    """
+    Draws a scene's layers in order, static ones chunk by chunk.
+    """
+
+    def __init__(self, scene, layer_names, chunked_layers, array_layers=None):
+
+        self.scene = scene
+
+        # Draw order, static layers are drawn through their ChunkedLayer
+        self.layer_names = list(layer_names)
+        self.chunked_layers = dict(chunked_layers)
+
+        # Maps a layer name to its StaticLayer, those layers are not in the scene
+        self.chunked_layers.update(array_layers or {})
+
+        # Counters for the last frame
+        self.chunks_drawn = 0
+        self.sprites_drawn = 0
+        self.visibility_updates = 0
+
+    def draw(self, left, bottom, width, height):
+        """Draw everything overlapping the view rectangle"""
+
+        right = left + width
+        top = bottom + height
+
+        self.chunks_drawn = 0
+        self.sprites_drawn = 0
+        self.visibility_updates = 0
+
+        for name in self.layer_names:
+            chunked = self.chunked_layers.get(name)
+            if chunked is None and name not in self.scene:
+                continue
+            # Layers hidden in Tiled stay hidden
+            visible = self.scene[name].visible if chunked is None else chunked.visible
+            if not visible:
+                continue
+
+            if chunked is None:
+                sprite_list = self.scene[name]
+                sprite_list.draw()
+                self.sprites_drawn += len(sprite_list)
+                continue
+
+            if chunked.update_visible(left, bottom, right, top):
+                self.visibility_updates += 1
+            self.sprites_drawn += chunked.draw()
+            self.chunks_drawn += len(chunked.visible_chunks)
+
+    def counters(self):
+        """Chunks and sprites submitted in the last frame"""
+        return {
+            "chunks_drawn": self.chunks_drawn,
+            "sprites_drawn": self.sprites_drawn,
+            "visibility_updates": self.visibility_updates,
+        }
@@ -0,0 +1,314 @@
+"""
+Enemies
+
+Enemies that patrol on their own, all of them updated together. Positions,
+speeds and states live in NumPy arrays and one update moves every enemy:
+gravity, patrol movement and collision with the "Platforms" layer are each a
+handful of array operations instead of a physics engine per enemy.
+
+Platform collision uses PlatformGrid, a dense grid with one cell per tile
+holding the box of the platform in that cell. An enemy is checked by looking
+up the cells under its corners, which keeps the cost per enemy flat no
+matter how big the map is. Enemies are expected to be smaller than a tile
+and fall at most MAX_FALL_SPEED per tick, so they can never skip a cell.
+
+Sprites are optional, the world runs without them. When sprites are attached
+only the enemies on screen get their sprite moved.
+
+Usage:
+    python enemies.py --count 5000 --ticks 600
+"""
+
+# type: ignore
+import argparse
+import time
+
+import numpy as np
+
+# Constants
+ENEMY_SPEED = 2
+
+# Half of the enemy hit box, the monster art is about 24 by 32 pixels
+ENEMY_HALF_WIDTH = 12
+ENEMY_HALF_HEIGHT = 16
+
+# Fastest an enemy falls per tick, kept below a tile so it always lands on platforms
+MAX_FALL_SPEED = 30
+
+# Enemies that fall this far below the map are gone
+KILL_Y = -500
+
+# How far in front of and below its feet an enemy looks for a ledge
+LEDGE_PROBE = 2
+
+
+class PlatformGrid:
+    """
+    Dense tile grid of platform boxes for looking up many points at once.
+    """
+
+    def __init__(self, boxes, cell_size):
+
+        self.cell_size = cell_size
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+
+        # First and last cell every box overlaps, a box ending on a cell edge does not reach the next cell
+        first_columns = np.floor(boxes[:, 0] / cell_size).astype(np.int64)
+        last_columns = np.maximum(first_columns, np.ceil(boxes[:, 1] / cell_size).astype(np.int64) - 1)
+        first_rows = np.floor(boxes[:, 2] / cell_size).astype(np.int64)
+        last_rows = np.maximum(first_rows, np.ceil(boxes[:, 3] / cell_size).astype(np.int64) - 1)
+
+        self.columns = max(int(last_columns.max()) + 1, 0) if len(boxes) else 0
+        self.rows = max(int(last_rows.max()) + 1, 0) if len(boxes) else 0
+
+        # left, right, bottom, top of the platform in each cell, NaN where there is none
+        # A platform wider than a cell is in every cell it overlaps, a cell with two platforms keeps the box around both
+        self.boxes = np.full((self.rows, self.columns, 4), np.nan)
+        for box, first_column, last_column, first_row, last_row in zip(
+                boxes.tolist(), first_columns.tolist(), last_columns.tolist(), first_rows.tolist(), last_rows.tolist()):
+            left, right, bottom, top = box
+            for row in range(max(first_row, 0), last_row + 1):
+                for column in range(max(first_column, 0), last_column + 1):
+                    cell = self.boxes[row, column]
+                    if np.isnan(cell[0]):
+                        cell[:] = box
+                    else:
+                        cell[:] = (min(cell[0], left), max(cell[1], right), min(cell[2], bottom), max(cell[3], top))
+
+    @classmethod
+    def from_sprite_list(cls, sprite_list, cell_size):
+        """Grid of the hit box bounds of every sprite in a layer"""
+        return cls([(sprite.left, sprite.right, sprite.bottom, sprite.top) for sprite in sprite_list], cell_size)
+
+    def boxes_at(self, x, y):
+        """
+        For arrays of points return a mask of the points inside a platform and
+        the (n, 4) boxes they are inside, rows of NaN where they are not.
+        """
+
+        columns = np.floor(x / self.cell_size).astype(np.int64)
+        rows = np.floor(y / self.cell_size).astype(np.int64)
+        inside_grid = (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+
+        boxes = np.full((len(x), 4), np.nan)
+        boxes[inside_grid] = self.boxes[rows[inside_grid], columns[inside_grid]]
+
+        # Comparisons with NaN are False so empty cells never hit
+        hit = (x >= boxes[:, 0]) & (x <= boxes[:, 1]) & (y >= boxes[:, 2]) & (y <= boxes[:, 3])
+        return hit, boxes
+
+
+class EnemySystem:
+    """
+    Every enemy in the level, stored as arrays.
+    """
+
+    def __init__(self, platform_grid, gravity, speed_scale=1.0):
+
+        self.platform_grid = platform_grid
+        self.gravity = gravity
+        # Spawn speeds and MAX_FALL_SPEED are per tick at 60 ticks per second, a world stepped faster scales them down
+        self.speed_scale = speed_scale
+
+        # Per enemy arrays, all the same length
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.change_x = np.zeros(0)
+        self.change_y = np.zeros(0)
+        self.speed = np.zeros(0)
+        self.direction = np.zeros(0)
+        self.min_x = np.zeros(0)
+        self.max_x = np.zeros(0)
+        self.on_ground = np.zeros(0, dtype=bool)
+        self.alive = np.zeros(0, dtype=bool)
+
+        # Sprites are attached by whoever draws the enemies, None until then
+        self.sprites = []
+        self.was_visible = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.x)
+
+    def spawn(self, x, y, speed=ENEMY_SPEED, patrol_distance=None):
+        """
+        Add enemies at arrays (or single values) of x and y. They walk right
+        first and turn around at walls, ledges and, when given, after
+        patrol_distance either side of where they started.
+        """
+
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+        count = len(x)
+        speed = np.broadcast_to(np.asarray(speed, dtype=np.float64) * self.speed_scale, (count,))
+
+        if patrol_distance is None:
+            min_x = np.full(count, -np.inf)
+            max_x = np.full(count, np.inf)
+        else:
+            min_x = x - patrol_distance
+            max_x = x + patrol_distance
+
+        self.x = np.concatenate([self.x, x])
+        self.y = np.concatenate([self.y, y])
+        self.change_x = np.concatenate([self.change_x, speed])
+        self.change_y = np.concatenate([self.change_y, np.zeros(count)])
+        self.speed = np.concatenate([self.speed, speed])
+        self.direction = np.concatenate([self.direction, np.ones(count)])
+        self.min_x = np.concatenate([self.min_x, min_x])
+        self.max_x = np.concatenate([self.max_x, max_x])
+        self.on_ground = np.concatenate([self.on_ground, np.zeros(count, dtype=bool)])
+        self.alive = np.concatenate([self.alive, np.ones(count, dtype=bool)])
+        self.sprites.extend([None] * count)
+        self.was_visible = np.concatenate([self.was_visible, np.zeros(count, dtype=bool)])
+
+    def spawn_from_objects(self, objects):
+        """Spawn an enemy at every point object of a Tiled object layer"""
+
+        for tiled_object in objects or ():
+            shape = tiled_object.shape
+            # Only point objects mark enemies, rectangles and polygons are skipped
+            if len(shape) != 2 or not isinstance(shape[0], (int, float)):
+                continue
+            properties = tiled_object.properties or {}
+            self.spawn(shape[0], shape[1] + ENEMY_HALF_HEIGHT,
+                       speed=properties.get("speed", ENEMY_SPEED),
+                       patrol_distance=properties.get("patrol_distance"))
+
+    def update(self):
+        """Move every enemy one tick"""
+
+        # The array operations have a fixed cost that is not worth paying for nothing
+        if not len(self.x):
+            return
+
+        grid = self.platform_grid
+        alive = self.alive
+
+        # Walk in the patrol direction, turning back at the ends of the patrol range
+        self.direction = np.where(self.x < self.min_x, 1.0, np.where(self.x > self.max_x, -1.0, self.direction))
+        self.change_x = np.where(alive, self.direction * self.speed, 0.0)
+        self.x += self.change_x
+
+        # Walls, the leading edge is checked near the feet and near the head
+        front = self.x + self.direction * ENEMY_HALF_WIDTH
+        hit_low, box_low = grid.boxes_at(front, self.y - ENEMY_HALF_HEIGHT + LEDGE_PROBE)
+        hit_high, box_high = grid.boxes_at(front, self.y + ENEMY_HALF_HEIGHT - LEDGE_PROBE)
+        wall = alive & (hit_low | hit_high)
+        box = np.where(hit_low[:, None], box_low, box_high)
+        # Pushed back out of the wall and turned around
+        self.x = np.where(wall & (self.direction > 0), box[:, 0] - ENEMY_HALF_WIDTH, self.x)
+        self.x = np.where(wall & (self.direction < 0), box[:, 1] + ENEMY_HALF_WIDTH, self.x)
+        self.direction = np.where(wall, -self.direction, self.direction)
+
+        # Ledges, enemies on the ground turn around instead of walking off
+        ahead = self.x + self.direction * (ENEMY_HALF_WIDTH + LEDGE_PROBE)
+        ground_ahead, _ = grid.boxes_at(ahead, self.y - ENEMY_HALF_HEIGHT - LEDGE_PROBE)
+        ledge = alive & self.on_ground & ~ground_ahead
+        self.direction = np.where(ledge, -self.direction, self.direction)
+
+        # Gravity, the world hands in the same constant the player's physics engine uses
+        self.change_y = np.where(alive, np.maximum(self.change_y - self.gravity, -MAX_FALL_SPEED * self.speed_scale), 0.0)
+        self.y += self.change_y
+
+        # Floors, checked under both corners of the feet
+        bottom = self.y - ENEMY_HALF_HEIGHT
+        left_hit, left_box = grid.boxes_at(self.x - ENEMY_HALF_WIDTH + 1, bottom)
+        right_hit, right_box = grid.boxes_at(self.x + ENEMY_HALF_WIDTH - 1, bottom)
+        falling = self.change_y <= 0
+        landed = alive & falling & (left_hit | right_hit)
+        floor = np.fmax(np.where(left_hit, left_box[:, 3], np.nan), np.where(right_hit, right_box[:, 3], np.nan))
+        self.y = np.where(landed, floor + ENEMY_HALF_HEIGHT, self.y)
+
+        # Ceilings
+        top = self.y + ENEMY_HALF_HEIGHT
+        left_hit, left_box = grid.boxes_at(self.x - ENEMY_HALF_WIDTH + 1, top)
+        right_hit, right_box = grid.boxes_at(self.x + ENEMY_HALF_WIDTH - 1, top)
+        bumped = alive & ~falling & (left_hit | right_hit)
+        ceiling = np.fmin(np.where(left_hit, left_box[:, 2], np.nan), np.where(right_hit, right_box[:, 2], np.nan))
+        self.y = np.where(bumped, ceiling - ENEMY_HALF_HEIGHT, self.y)
+
+        self.change_y = np.where(landed | bumped, 0.0, self.change_y)
+        self.on_ground = landed
+
+        # Enemies that fell out of the level stop being updated
+        self.alive = alive & (self.y > KILL_Y)
+
+    def attach_sprite(self, index, sprite):
+        """Use a sprite to draw one enemy"""
+        self.sprites[index] = sprite
+        sprite.position = (self.x[index], self.y[index])
+
+    def sync_sprites(self, left, bottom, width, height, x=None, y=None, animations=None):
+        """
+        Move the sprites of enemies inside the view rectangle to their
+        positions. Sprites that just left the view are hidden so they do not
+        show up at an old position later. Returns how many sprites were touched.
+
+        x and y are the positions to draw at when they are not the current
+        ones, like positions blended between two ticks. animations is the
+        AnimationSystem animating the sprites by enemy index, sprites coming
+        into view get its current frame since it only sets visible ones.
+        """
+
+        if not len(self.x):
+            return 0
+
+        x = self.x if x is None else x
+        y = self.y if y is None else y
+
+        visible = (self.alive
+                   & (x + ENEMY_HALF_WIDTH >= left) & (x - ENEMY_HALF_WIDTH <= left + width)
+                   & (y + ENEMY_HALF_HEIGHT >= bottom) & (y - ENEMY_HALF_HEIGHT <= bottom + height))
+
+        touched = np.flatnonzero(visible | self.was_visible)
+        if animations is not None:
+            animations.show(np.flatnonzero(visible & ~self.was_visible))
+        self.was_visible = visible
+
+        sprites = self.sprites
+        for index in touched.tolist():
+            sprite = sprites[index]
+            if sprite is None:
+                continue
+            sprite.visible = bool(visible[index])
+            if sprite.visible:
+                sprite.position = (x[index], y[index])
+        return len(touched)
+
+
+def main():
+    """Spawn enemies on random platforms of the level and time the update"""
+    import arcade
+
+    # Imported here because world.py builds its enemies through this module
+    from world import GRAVITY, LAYER_OPTIONS, MAP_PATH, TILE_SCALING
+
+    parser = argparse.ArgumentParser(description="Benchmark the batched enemy update")
+    parser.add_argument("--count", type=int, default=5000, help="number of enemies")
+    parser.add_argument("--ticks", type=int, default=600, help="number of updates to time")
+    args = parser.parse_args()
+
+    tile_map = arcade.load_tilemap(MAP_PATH, scaling=TILE_SCALING, layer_options=LAYER_OPTIONS)
+    platforms = tile_map.sprite_lists["Platforms"]
+    grid = PlatformGrid.from_sprite_list(platforms, tile_map.tile_width * TILE_SCALING)
+
+    # Every enemy starts standing on top of a random platform
+    rng = np.random.default_rng(0)
+    tops = np.array([(sprite.center_x, sprite.top) for sprite in platforms])
+    picks = tops[rng.integers(0, len(tops), args.count)]
+
+    enemies = EnemySystem(grid, GRAVITY)
+    enemies.spawn(picks[:, 0], picks[:, 1] + ENEMY_HALF_HEIGHT, speed=rng.uniform(1, 3, args.count))
+
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        enemies.update()
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.count} enemies, {args.ticks / elapsed:.0f} ticks/s, {elapsed / args.ticks * 1000:.3f} ms per tick, "
+          f"{int(enemies.alive.sum())} still in the level")
+
+
+if __name__ == "__main__":
+    main()
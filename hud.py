@@ -0,0 +1,80 @@
+"""
+HUD
+
+Every label on the HUD lives in one pyglet Batch and is drawn with a single
+draw call. A label's value is only handed to pyglet, which lays the text out
+again and uploads new glyph geometry, when it differs from what is on
+screen, and values set several times in a tick are only applied once by
+flush().
+
+    hud.add_label("score", "Score: {}", 0, x=640, y=650, anchor_x="center")
+    hud.set("score", 3)
+    hud.flush()
+    hud.draw()
+"""
+
+# type: ignore
+import arcade
+from pyglet.graphics import Batch
+
+
+class HudLabel:
+    """
+    One label, its format string and the value it currently shows.
+    """
+
+    def __init__(self, text, template, value):
+        self.text = text
+        self.template = template
+        self.value = value
+
+
+class Hud:
+    """
+    Static and changing labels drawn together.
+    """
+
+    def __init__(self):
+
+        self.batch = Batch()
+
+        # Maps a label name to its HudLabel
+        self.labels = {}
+
+        # Values set since the last flush, only the last one per label counts
+        self.pending = {}
+
+        # Number of times a label's text was laid out again, for profiling
+        self.layouts = 0
+
+    def add_label(self, name, template, value=None, x=0, y=0, **text_options):
+        """
+        Add a label showing template.format(value). A template without a
+        placeholder is a static label that is laid out once.
+        """
+
+        text = arcade.Text(template.format(value), x=x, y=y, batch=self.batch, **text_options)
+        self.labels[name] = HudLabel(text, template, value)
+
+    def set(self, name, value):
+        """Queue a new value for a label, it shows after the next flush()"""
+        self.pending[name] = value
+
+    def flush(self):
+        """Apply the queued values, laying out only labels whose value changed"""
+
+        if not self.pending:
+            return
+        for name, value in self.pending.items():
+            label = self.labels[name]
+            if value == label.value:
+                continue
+            label.value = value
+            label.text.text = label.template.format(value)
+            self.layouts += 1
+        self.pending.clear()
+
+    def draw(self):
+        """Draw every label with one batch draw"""
+        self.flush()
+        self.batch.draw()
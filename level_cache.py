@@ -0,0 +1,218 @@
+"""
+Level Cache
+
+Keeps parsed levels in memory so restarting does not load the tilemap again.
+The first load of a map parses the Tiled file and builds every layer, after
+that a restart only puts back the collected pickups. Static layers such as
+"Platforms" are kept as they are, spatial hash included.
+
+A cache belongs to one world at a time because the scene it hands out is the
+one being played. Call evict() or clear() when switching levels to free the
+memory of levels that are no longer needed.
+"""
+
+# type: ignore
+import arcade
+
+from collectibles import build_collectibles
+from enemies import PlatformGrid
+from level_compiler import COMPILED_EXTENSION, load_compiled_level
+from static_layers import StaticLayer, static_layer_names
+from streaming import STREAMED_EXTENSION, StreamedLevel
+
+# Constants
+# Rough size of one arcade.Sprite with its hit box, used for the memory estimate
+SPRITE_BYTES_ESTIMATE = 1200
+
+
+class CachedLevel:
+    """
+    One parsed level with its scene and pickup grids.
+    """
+
+    # Everything is loaded up front, see StreamedLevel for levels loaded in chunks
+    streamed = False
+
+    def __init__(self, map_path, tile_map, layer_options):
+
+        self.map_path = map_path
+        self.tile_map = tile_map
+
+        # Tile layers in map order, taken before static layers leave sprite_lists
+        self.layer_names = list(getattr(tile_map, "layer_names", tile_map.sprite_lists))
+
+        # Layers kept as arrays instead of sprites, compiled levels come with theirs already built
+        # and a Tiled map's are converted here so the sprites arcade made can be let go
+        self.static_layers = dict(getattr(tile_map, "static_layers", {}))
+        for name in static_layer_names(layer_options):
+            if name in tile_map.sprite_lists:
+                self.static_layers[name] = StaticLayer.from_sprite_list(tile_map.sprite_lists.pop(name))
+
+        self.scene = arcade.Scene.from_tilemap(tile_map)
+        self.collectibles = build_collectibles(self.scene, layer_options)
+
+        # Platforms never move, so the grid enemies collide against is built once per level
+        cell_size = tile_map.tile_width * tile_map.scaling
+        if "Platforms" in self.static_layers:
+            self.platform_grid = PlatformGrid(self.static_layers["Platforms"].boxes, cell_size)
+        else:
+            platforms = self.scene["Platforms"] if "Platforms" in self.scene else []
+            self.platform_grid = PlatformGrid.from_sprite_list(platforms, cell_size)
+
+        # Every sprite the pickup layers started with, in map order, so they can be put back
+        self.initial_pickups = {name: list(self.scene[name]) for name in self.collectibles}
+
+        # How many of each pickup the whole level holds
+        self.pickup_counts = {name: len(sprites) for name, sprites in self.initial_pickups.items()}
+
+    def reset(self):
+        """Put every collected pickup back"""
+
+        for name, sprites in self.initial_pickups.items():
+            sprite_list = self.scene[name]
+            # Refills in the original order so a restart looks the same as a fresh load
+            if len(sprite_list) != len(sprites):
+                sprite_list.clear()
+                sprite_list.extend(sprites)
+
+            index = self.collectibles[name]
+            for sprite in sprites:
+                if sprite not in index.sprite_cells:
+                    index.add(sprite)
+
+    def stream(self, position):
+        """The whole level is already loaded, nothing to do wherever the player is"""
+
+    def close(self):
+        """Nothing runs in the background for a fully loaded level"""
+
+    def sprite_count(self):
+        """Number of sprites the level holds, collected pickups included, tiles of static layers are not sprites"""
+
+        count = 0
+        for name, sprite_list in self.tile_map.sprite_lists.items():
+            if name in self.initial_pickups:
+                count += len(self.initial_pickups[name])
+            else:
+                count += len(sprite_list)
+        return count
+
+    def textures(self):
+        """Every distinct texture used by the level's sprites"""
+
+        textures = {}
+        for sprite_list in self.tile_map.sprite_lists.values():
+            for sprite in sprite_list:
+                textures[id(sprite.texture)] = sprite.texture
+        for sprites in self.initial_pickups.values():
+            for sprite in sprites:
+                textures[id(sprite.texture)] = sprite.texture
+        for layer in self.static_layers.values():
+            for texture in layer.textures:
+                textures[id(texture)] = texture
+        return list(textures.values())
+
+
+def build_level(map_path, scaling, layer_options, lazy=False):
+    """
+    Parse a map into a new CachedLevel, or a StreamedLevel for .stream
+    directories. With lazy the sprite lists get no GPU buffers until they
+    are drawn or initialized, so this can run off the main thread.
+    """
+
+    # Streamed levels load their chunks as the player moves
+    if map_path.rstrip("/\\").endswith(STREAMED_EXTENSION):
+        return StreamedLevel(map_path, layer_options, SPRITE_BYTES_ESTIMATE)
+
+    # Compiled levels already have their scaling and layer options baked in
+    if map_path.endswith(COMPILED_EXTENSION):
+        tile_map = load_compiled_level(map_path, lazy=lazy, static_layers=static_layer_names(layer_options))
+        if abs(tile_map.scaling - scaling) > 1e-6:
+            raise ValueError(f"{map_path} was compiled with scaling {tile_map.scaling}, expected {scaling}")
+    else:
+        tile_map = arcade.load_tilemap(map_path, scaling=scaling, layer_options=layer_options, lazy=lazy)
+    return CachedLevel(map_path, tile_map, layer_options)
+
+
+class LevelCache:
+    """
+    Parsed levels and loaded textures kept between restarts.
+    """
+
+    def __init__(self):
+
+        # Maps a map path to its CachedLevel
+        self.levels = {}
+
+        # Maps a texture path to its arcade.Texture
+        self.textures = {}
+
+    def load_level(self, map_path, scaling, layer_options):
+        """
+        Return the level for map_path ready to play. Parses the map only the
+        first time, later calls put the pickups back and return the same level.
+        """
+
+        level = self.levels.get(map_path)
+        if level is None:
+            level = build_level(map_path, scaling, layer_options)
+            self.levels[map_path] = level
+        else:
+            level.reset()
+        return level
+
+    def add_level(self, map_path, level):
+        """Keep a level built elsewhere, such as on a loader thread, for load_level() to hand out"""
+        self.levels[map_path] = level
+
+    def load_texture(self, path):
+        """Load a texture once and hand back the same one after that"""
+
+        texture = self.textures.get(path)
+        if texture is None:
+            texture = arcade.load_texture(path)
+            self.textures[path] = texture
+        return texture
+
+    def evict(self, map_path):
+        """Forget one level, returns True if it was cached"""
+        level = self.levels.pop(map_path, None)
+        if level is None:
+            return False
+        level.close()
+        return True
+
+    def clear(self):
+        """Forget every level and texture"""
+        for level in self.levels.values():
+            level.close()
+        self.levels.clear()
+        self.textures.clear()
+
+    def memory_footprint(self):
+        """
+        Estimate of what the cache keeps alive, in a dict with the number of
+        levels and sprites, the decoded texture bytes and the total bytes.
+        """
+
+        textures = {id(texture): texture for texture in self.textures.values()}
+        sprites = 0
+        static_bytes = 0
+        for level in self.levels.values():
+            sprites += level.sprite_count()
+            static_bytes += sum(layer.nbytes() for layer in level.static_layers.values())
+            for texture in level.textures():
+                textures[id(texture)] = texture
+
+        texture_bytes = 0
+        for texture in textures.values():
+            image = texture.image
+            texture_bytes += image.width * image.height * len(image.getbands())
+
+        return {
+            "levels": len(self.levels),
+            "sprites": sprites,
+            "texture_bytes": texture_bytes,
+            "static_bytes": static_bytes,
+            "estimated_bytes": texture_bytes + static_bytes + sprites * SPRITE_BYTES_ESTIMATE,
+        }
@@ -0,0 +1,420 @@
+"""
+Level Compiler
+
+Turns a Tiled map into a compact binary level (.plvl) ahead of time and loads
+it back through a memory map. The compiled file holds the tile scaling and
+layer options that were used, so loading it skips JSON parsing, tileset
+lookups and hit box calculation. Positions are stored already scaled and hit
+boxes are stored once in a shared polygon table that textures and sprites
+point into.
+
+File layout (little endian, every section starts on a 4 byte boundary):
+    header    magic "PLVL", version (u16), pad (u16), scaling (f32),
+              map width, map height, tile width, tile height,
+              texture count, layer count, polygon count, point count (u32 each)
+    textures  per texture: path length (u16), flip bits (u8), pad (u8),
+              crop x, y, width, height (i32 each), hit box polygon (u32),
+              path (utf-8), pad
+    polygons  first point and point count (u32 each) for every hit box
+    points    hit box points as x, y (f32) pairs
+    layers    per layer: name length (u16), flags (u16), sprite count (u32),
+              name (utf-8), pad, then one flat array per field:
+              texture id, hit box polygon (u32), center x, center y,
+              scale x, scale y, angle (f32)
+
+Usage:
+    python level_compiler.py compile :resources:tiled_maps/map2_level_1.json map2_level_1.plvl
+    python level_compiler.py bench :resources:tiled_maps/map2_level_1.json map2_level_1.plvl
+"""
+
+# type: ignore
+import argparse
+import mmap
+import os
+import struct
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import arcade
+import numpy as np
+from arcade.hitbox import RotatableHitBox
+
+from static_layers import StaticLayer, tile_boxes
+
+# Constants
+COMPILED_EXTENSION = ".plvl"
+
+MAGIC = b"PLVL"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHfIIIIIIII")
+TEXTURE = struct.Struct("<HBBiiiiI")
+POLYGON = struct.Struct("<II")
+LAYER = struct.Struct("<HHI")
+
+# Layer flags
+FLAG_SPATIAL_HASH = 1
+
+# Flip bits, applied in the same order arcade's tilemap applies them
+FLIP_DIAGONALLY = 1
+FLIP_HORIZONTALLY = 2
+FLIP_VERTICALLY = 4
+
+# Per sprite arrays of a layer, in file order
+LAYER_FIELDS = ("texture_ids", "polygon_ids", "center_x", "center_y", "scale_x", "scale_y", "angle")
+
+
+def _pad(length):
+    """Bytes needed to bring length up to a multiple of 4"""
+    return -length % 4
+
+
+def _flip(texture, flips):
+    """Apply flip bits to a texture"""
+
+    if flips & FLIP_DIAGONALLY:
+        texture = texture.flip_diagonally()
+    if flips & FLIP_HORIZONTALLY:
+        texture = texture.flip_horizontally()
+    if flips & FLIP_VERTICALLY:
+        texture = texture.flip_vertically()
+    return texture
+
+
+def _find_flips(texture):
+    """Work out which flip bits turn an unflipped texture into this one"""
+
+    base = arcade.Texture(texture.image, hash=texture.image_data.hash)
+    for flips in range(8):
+        if _flip(base, flips)._vertex_order == texture._vertex_order:
+            return flips
+    return 0
+
+
+class CompiledLevel:
+    """
+    A level loaded from a .plvl file. Has the same sprite_lists and size
+    attributes the rest of the game reads from an arcade TileMap.
+    """
+
+    def __init__(self, scaling, width, height, tile_width, tile_height, sprite_lists, static_layers=None,
+                 layer_names=None):
+        self.scaling = scaling
+        self.width = width
+        self.height = height
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.sprite_lists = sprite_lists
+
+        # Layers loaded as StaticLayer arrays instead of sprites, they are not in sprite_lists
+        self.static_layers = static_layers if static_layers is not None else {}
+
+        # Every tile layer in map order, sprite and static ones mixed, the order they are drawn in
+        self.layer_names = list(layer_names) if layer_names is not None else list(sprite_lists) + list(self.static_layers)
+
+        # Object layers are not compiled, the attribute is here so code reading a TileMap works unchanged
+        self.object_lists = {}
+
+
+def compile_level(map_path, out_path, scaling, layer_options):
+    """Load a Tiled map the normal way and write it out as a compiled level"""
+
+    tile_map = arcade.load_tilemap(map_path, scaling=scaling, layer_options=layer_options)
+    write_level(out_path, tile_map, tile_map.sprite_lists, layer_options)
+
+
+def write_level(out_path, tile_map, sprite_lists, layer_options):
+    """
+    Write sprite lists out as a compiled level. tile_map gives the scaling and
+    map size, sprite_lists maps layer names to any iterable of sprites so a
+    part of a map can be written on its own.
+    """
+
+    scaling = tile_map.scaling
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+
+    # Distinct textures in first use order, a sprite only stores the index into this
+    texture_ids = {}
+    texture_entries = []
+
+    # Distinct hit box polygons, shared by every texture and sprite with the same points
+    polygon_ids = {}
+    polygons = []
+    points = []
+
+    def polygon_id(hit_box):
+        """Index of a hit box in the polygon table, adding it the first time"""
+        hit_box = tuple(tuple(point) for point in hit_box)
+        if hit_box not in polygon_ids:
+            polygon_ids[hit_box] = len(polygons)
+            polygons.append((len(points), len(hit_box)))
+            points.extend(hit_box)
+        return polygon_ids[hit_box]
+
+    layers = []
+    for name, sprite_list in sprite_lists.items():
+        arrays = {field: [] for field in LAYER_FIELDS}
+        for sprite in sprite_list:
+            texture = sprite.texture
+            key = texture.atlas_name
+            if key not in texture_ids:
+                texture_ids[key] = len(texture_entries)
+
+                # Paths are kept relative to the compiled file when they can be
+                path = str(texture.file_path)
+                try:
+                    path = os.path.relpath(path, out_dir)
+                except ValueError:
+                    pass
+
+                texture_entries.append((path.encode("utf-8"), _find_flips(texture), texture.crop_values or (0, 0, 0, 0), polygon_id(texture.hit_box_points)))
+
+            # Tiles with collision shapes drawn in Tiled have their own hit box
+            arrays["texture_ids"].append(texture_ids[key])
+            arrays["polygon_ids"].append(polygon_id(sprite.hit_box.points))
+            arrays["center_x"].append(sprite.center_x)
+            arrays["center_y"].append(sprite.center_y)
+            arrays["scale_x"].append(sprite.scale_x)
+            arrays["scale_y"].append(sprite.scale_y)
+            arrays["angle"].append(sprite.angle)
+
+        flags = FLAG_SPATIAL_HASH if layer_options.get(name, {}).get("use_spatial_hash") else 0
+        layers.append((name.encode("utf-8"), flags, len(sprite_list), arrays))
+
+    with open(out_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, 0, scaling, tile_map.width, tile_map.height, tile_map.tile_width,
+                               tile_map.tile_height, len(texture_entries), len(layers), len(polygons), len(points)))
+
+        for path, flips, crop, polygon in texture_entries:
+            file.write(TEXTURE.pack(len(path), flips, 0, *crop, polygon))
+            file.write(path + b"\0" * _pad(len(path)))
+
+        for polygon in polygons:
+            file.write(POLYGON.pack(*polygon))
+
+        file.write(struct.pack(f"<{len(points) * 2}f", *[value for point in points for value in point]))
+
+        for name, flags, count, arrays in layers:
+            file.write(LAYER.pack(len(name), flags, count))
+            file.write(name + b"\0" * _pad(len(name)))
+            for field in LAYER_FIELDS:
+                array_type = "I" if field.endswith("_ids") else "f"
+                file.write(struct.pack(f"<{count}{array_type}", *arrays[field]))
+
+
+def load_compiled_level(path, texture_cache=None, lazy=False, static_layers=()):
+    """
+    Memory map a compiled level and build its sprite lists straight from the packed arrays.
+
+    texture_cache is an optional dict shared between loads so levels cut from
+    the same tilesets reuse one texture per tile. lazy=True leaves the sprite
+    lists without GPU buffers, which is needed when loading off the main thread.
+    Layers named in static_layers become StaticLayers without making a sprite.
+    """
+
+    if texture_cache is None:
+        texture_cache = {}
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        view = memoryview(data)
+        try:
+            (magic, version, _, scaling, width, height, tile_width, tile_height,
+             texture_count, layer_count, polygon_count, point_count) = HEADER.unpack_from(data, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a compiled level")
+            if version != VERSION:
+                raise ValueError(f"{path} has level version {version}, expected {VERSION}")
+            offset = HEADER.size
+
+            texture_entries = []
+            for _ in range(texture_count):
+                path_length, flips, _, x, y, crop_width, crop_height, polygon = TEXTURE.unpack_from(data, offset)
+                offset += TEXTURE.size
+                texture_path = bytes(view[offset:offset + path_length]).decode("utf-8")
+                offset += path_length + _pad(path_length)
+                texture_entries.append((texture_path, flips, (x, y, crop_width, crop_height), polygon))
+
+            polygon_data = view[offset:offset + polygon_count * POLYGON.size].cast("I")
+            offset += polygon_count * POLYGON.size
+            point_data = view[offset:offset + point_count * 8].cast("f")
+            offset += point_count * 8
+
+            # Hit boxes are turned into point tuples once and shared after that
+            hit_boxes = []
+            for polygon in range(polygon_count):
+                first, count = polygon_data[polygon * 2], polygon_data[polygon * 2 + 1]
+                hit_boxes.append(tuple(zip(point_data[first * 2:(first + count) * 2:2],
+                                           point_data[first * 2 + 1:(first + count) * 2:2])))
+            polygon_data.release()
+            point_data.release()
+
+            # left, right, bottom, top of every hit box before scaling, for StaticLayer boxes
+            polygon_bounds = np.array([(min(x for x, _ in points), max(x for x, _ in points),
+                                        min(y for _, y in points), max(y for _, y in points))
+                                       for points in hit_boxes], dtype=np.float64).reshape(-1, 4)
+
+            # Each image file is decoded once no matter how many textures are cut from it
+            images = {}
+            textures = []
+            texture_polygons = []
+            for texture_path, flips, crop, polygon in texture_entries:
+                if not os.path.isabs(texture_path):
+                    texture_path = os.path.normpath(os.path.join(base_dir, texture_path))
+                texture_polygons.append(polygon)
+
+                key = (texture_path, flips, crop)
+                texture = texture_cache.get(key)
+                if texture is not None:
+                    textures.append(texture)
+                    continue
+
+                image = images.get(texture_path)
+                if image is None:
+                    image = arcade.load_image(texture_path)
+                    images[texture_path] = image
+
+                x, y, crop_width, crop_height = crop
+                if crop_width and crop_height and (crop_width, crop_height) != image.size:
+                    tile_image = image.crop((x, y, x + crop_width, y + crop_height))
+                else:
+                    tile_image = image
+
+                texture = arcade.Texture(tile_image, hit_box_points=hit_boxes[polygon])
+                texture.file_path = texture_path
+                texture = _flip(texture, flips)
+                texture_cache[key] = texture
+                textures.append(texture)
+
+            sprite_lists = {}
+            static = {}
+            layer_names = []
+            for _ in range(layer_count):
+                name_length, flags, count = LAYER.unpack_from(data, offset)
+                offset += LAYER.size
+                name = bytes(view[offset:offset + name_length]).decode("utf-8")
+                offset += name_length + _pad(name_length)
+                layer_names.append(name)
+
+                arrays = []
+                for field in LAYER_FIELDS:
+                    arrays.append(view[offset:offset + count * 4].cast("I" if field.endswith("_ids") else "f"))
+                    offset += count * 4
+                texture_ids, polygon_ids, center_x, center_y, scale_x, scale_y, angle = arrays
+
+                if name in static_layers:
+                    # Copied out of the memory map, the file is closed once loading is done
+                    ids, polygons, xs, ys, scales_x, scales_y, angles = (np.array(array, dtype=np.float64) for array in arrays)
+                    ids = ids.astype(np.int64)
+                    sizes = np.array([(texture.width, texture.height) for texture in textures], dtype=np.float64).reshape(-1, 2)[ids]
+                    boxes = tile_boxes(xs, ys, polygon_bounds[polygons.astype(np.int64)], scales_x, scales_y, angles)
+                    static[name] = StaticLayer(textures, ids, xs, ys, sizes[:, 0] * scales_x, sizes[:, 1] * scales_y, angles, boxes)
+                    for array in arrays:
+                        array.release()
+                    continue
+
+                sprite_list = arcade.SpriteList(use_spatial_hash=bool(flags & FLAG_SPATIAL_HASH), lazy=lazy)
+                sprites = []
+                for index in range(count):
+                    texture_id = texture_ids[index]
+                    position = (center_x[index], center_y[index])
+                    scale = (scale_x[index], scale_y[index])
+                    sprite = arcade.Sprite(textures[texture_id], scale=scale,
+                                           center_x=position[0], center_y=position[1], angle=angle[index])
+                    # Only sprites whose hit box differs from their texture's get their own
+                    polygon = polygon_ids[index]
+                    if polygon != texture_polygons[texture_id]:
+                        sprite.hit_box = RotatableHitBox(hit_boxes[polygon], position=position, angle=angle[index], scale=scale)
+                    sprites.append(sprite)
+                sprite_list.extend(sprites)
+                sprite_lists[name] = sprite_list
+
+                for array in arrays:
+                    array.release()
+        finally:
+            view.release()
+
+    return CompiledLevel(scaling, width, height, tile_width, tile_height, sprite_lists, static, layer_names)
+
+
+def _measure(kind, path, scaling, layer_options):
+    """
+    Load one level in this process and return seconds taken and peak memory
+    in kilobytes. Peak RSS where the resource module exists, on Windows the
+    peak of Python's own allocations, which tracemalloc has to watch for.
+    """
+
+    # resource is POSIX only, imported here so the game itself still runs on Windows
+    try:
+        import resource
+    except ImportError:
+        resource = None
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    if kind == "json":
+        tile_map = arcade.load_tilemap(path, scaling=scaling, layer_options=layer_options)
+        sprites = sum(len(sprite_list) for sprite_list in tile_map.sprite_lists.values())
+    else:
+        level = load_compiled_level(path)
+        sprites = sum(len(sprite_list) for sprite_list in level.sprite_lists.values())
+    elapsed = time.perf_counter() - start
+
+    if resource is None:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, peak // 1024, sprites
+
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak //= 1024
+    return elapsed, peak, sprites
+
+
+def main():
+    """Compile a map or compare load time and peak RSS of the JSON and compiled versions"""
+
+    # Imported here because world.py loads levels through this module
+    from world import LAYER_OPTIONS, TILE_SCALING
+
+    parser = argparse.ArgumentParser(description="Compile Tiled maps into binary levels")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    compile_command = commands.add_parser("compile", help="write a .plvl file for a Tiled map")
+    compile_command.add_argument("map", help="Tiled map to compile")
+    compile_command.add_argument("out", help="compiled level to write")
+
+    bench_command = commands.add_parser("bench", help="compare loading the Tiled map and the compiled level")
+    bench_command.add_argument("map", help="Tiled map")
+    bench_command.add_argument("compiled", help="compiled level made from the same map")
+
+    measure_command = commands.add_parser("measure", help=argparse.SUPPRESS)
+    measure_command.add_argument("kind", choices=("json", "compiled"))
+    measure_command.add_argument("path")
+
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        compile_level(args.map, args.out, TILE_SCALING, LAYER_OPTIONS)
+        print(f"wrote {args.out} ({os.path.getsize(args.out)} bytes)")
+
+    elif args.command == "measure":
+        elapsed, peak, sprites = _measure(args.kind, args.path, TILE_SCALING, LAYER_OPTIONS)
+        print(f"{elapsed} {peak} {sprites}")
+
+    else:
+        # Each load runs in a fresh process so peak RSS is not shared between them
+        for kind, path in (("json", args.map), ("compiled", args.compiled)):
+            output = subprocess.run([sys.executable, __file__, "measure", kind, path],
+                                    check=True, capture_output=True, text=True).stdout.split()
+            elapsed, peak, sprites = float(output[-3]), int(output[-2]), int(output[-1])
+            print(f"{kind:>8}: {sprites} sprites, {elapsed * 1000:.1f} ms, peak memory {peak / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
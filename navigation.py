@@ -0,0 +1,475 @@
+"""
+Navigation
+
+A graph of where the player can go on a map's "Platforms" layer. Nodes are
+the tiles the player can stand on, and edges are the moves between them:
+walking to the next tile, falling off a ledge and jumping. Falls and jumps
+are found by stepping the same motion PhysicsEnginePlatformer uses (gravity
+taken off the vertical speed, then the move) from the gravity, jump speed
+and movement speed the game plays with, against the platform boxes of
+PlatformGrid, so an edge exists only if the game can really make that move.
+The player's box comes from its sprite's hit box, see player_box().
+
+The graph is stored in flat arrays: edges sorted by the node they leave,
+with the path of every edge in one shared point array, so the moves out of
+a node and the shape of a move are both a slice. Building a graph means
+stepping thousands of arcs, so it is saved next to the map and only built
+again when the platforms or the constants change.
+
+Jumps are the ones made with UP held to the top of the arc while running
+left or right, releasing UP early makes lower jumps the graph leaves out.
+
+Usage:
+    python navigation.py build :resources:tiled_maps/map2_level_1.json
+    python navigation.py path :resources:tiled_maps/map2_level_1.json 96 128 1900 400
+"""
+
+# type: ignore
+import argparse
+import hashlib
+import heapq
+import math
+import os
+import time
+
+import arcade
+import numpy as np
+
+from level_cache import LevelCache
+from world import (GRAVITY, LAYER_OPTIONS, MAP_PATH, PLAYER_JUMP_SPEED, PLAYER_MOVEMENT_SPEED, PLAYER_START_X,
+                   PLAYER_START_Y, PLAYER_TEXTURE_PATH, TILE_SCALING)
+
+# Constants
+NAVIGATION_EXTENSION = ".nav.npz"
+
+# Bump when the way graphs are built changes, older cached graphs are built again
+NAVIGATION_VERSION = 2
+
+# arcade's engine lifts a landing player out of the ground by this much at a time
+LANDING_STEP = 0.25
+
+# Falls and jumps that have not landed after this many ticks are dropped
+MAX_ARC_TICKS = 240
+
+# Edge kinds
+WALK = 0
+FALL = 1
+JUMP = 2
+
+EDGE_KIND_NAMES = ("walk", "fall", "jump")
+
+
+class NavigationGraph:
+    """
+    Standing tiles and the moves between them, stored as arrays.
+    """
+
+    def __init__(self, cell_size, node_x, node_y, node_cells, edge_offsets, edge_target, edge_kind,
+                 edge_ticks, point_offsets, points):
+
+        self.cell_size = cell_size
+
+        # Where the player stands on each node, the middle of the tile top
+        self.node_x = node_x
+        self.node_y = node_y
+        # (column, row) of the tile under each node
+        self.node_cells = node_cells
+
+        # Edges leaving node n are edge_offsets[n] up to edge_offsets[n + 1]
+        self.edge_offsets = edge_offsets
+        self.edge_target = edge_target
+        self.edge_kind = edge_kind
+        # Ticks the move takes
+        self.edge_ticks = edge_ticks
+
+        # Path of edge e, one point per tick, is points[point_offsets[e]:point_offsets[e + 1]]
+        self.point_offsets = point_offsets
+        self.points = points
+
+        # (column, row) -> node, and column -> nodes in it sorted by height, for position lookups
+        self.node_at_cell = {(int(column), int(row)): node for node, (column, row) in enumerate(node_cells.tolist())}
+        self.column_nodes = {}
+        for node in np.argsort(node_y, kind="stable").tolist():
+            self.column_nodes.setdefault(int(node_cells[node, 0]), []).append(node)
+
+    def __len__(self):
+        return len(self.node_x)
+
+    @property
+    def edge_count(self):
+        return len(self.edge_target)
+
+    def edges_from(self, node):
+        """Range of the edge ids leaving a node"""
+        return range(self.edge_offsets[node], self.edge_offsets[node + 1])
+
+    def edge_points(self, edge):
+        """(n, 2) view of the positions the player passes through on an edge"""
+        return self.points[self.point_offsets[edge]:self.point_offsets[edge + 1]]
+
+    def edge_bounds(self, edge):
+        """left, right, bottom, top of an edge's path"""
+        points = self.edge_points(edge)
+        return points[:, 0].min(), points[:, 0].max(), points[:, 1].min(), points[:, 1].max()
+
+    def nearest_node(self, x, y):
+        """
+        The node a position is standing on or above in its column, allowing up
+        to one tile of overlap with the ground, None if the column has no node.
+        """
+
+        nodes = self.column_nodes.get(math.floor(x / self.cell_size))
+        if not nodes:
+            return None
+        best = nodes[0]
+        for node in nodes:
+            if self.node_y[node] <= y + self.cell_size:
+                best = node
+        return best
+
+    def find_path(self, start, goal):
+        """Edge ids of the quickest route from one node to another, None when it cannot be reached"""
+
+        best_ticks = {start: 0}
+        came_by = {}
+        queue = [(0, start)]
+        while queue:
+            ticks, node = heapq.heappop(queue)
+            if node == goal:
+                break
+            if ticks > best_ticks[node]:
+                continue
+            for edge in self.edges_from(node):
+                target = int(self.edge_target[edge])
+                total = ticks + int(self.edge_ticks[edge])
+                if total < best_ticks.get(target, total + 1):
+                    best_ticks[target] = total
+                    came_by[target] = edge
+                    heapq.heappush(queue, (total, target))
+
+        if goal not in best_ticks:
+            return None
+        path = []
+        node = goal
+        while node != start:
+            edge = came_by[node]
+            path.append(edge)
+            node = self._edge_source(edge)
+        path.reverse()
+        return path
+
+    def reachable_from(self, start):
+        """Set of every node that can be reached from a node"""
+
+        seen = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for edge in self.edges_from(node):
+                target = int(self.edge_target[edge])
+                if target not in seen:
+                    seen.add(target)
+                    stack.append(target)
+        return seen
+
+    def _edge_source(self, edge):
+        return int(np.searchsorted(self.edge_offsets, edge, side="right")) - 1
+
+    def save(self, path, key):
+        np.savez(path, key=np.frombuffer(key, dtype=np.uint8), cell_size=np.float64(self.cell_size),
+                 node_x=self.node_x, node_y=self.node_y, node_cells=self.node_cells,
+                 edge_offsets=self.edge_offsets, edge_target=self.edge_target, edge_kind=self.edge_kind,
+                 edge_ticks=self.edge_ticks, point_offsets=self.point_offsets, points=self.points)
+
+    @classmethod
+    def load(cls, path, key):
+        """A graph saved with the same key, None if the file is missing or was built from something else"""
+
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if data["key"].tobytes() != key:
+                return None
+            return cls(float(data["cell_size"]), data["node_x"], data["node_y"], data["node_cells"],
+                       data["edge_offsets"], data["edge_target"], data["edge_kind"], data["edge_ticks"],
+                       data["point_offsets"], data["points"])
+
+
+def player_box(sprite):
+    """
+    The left and right edges of a sprite's hit box relative to its center_x,
+    and the hit box height, which is what the graph moves around.
+    """
+    return sprite.left - sprite.center_x, sprite.right - sprite.center_x, sprite.top - sprite.bottom
+
+
+class _Body:
+    """
+    Steps the player's box through a PlatformGrid the way the physics engine moves it.
+    """
+
+    def __init__(self, platform_grid, gravity, player):
+        self.grid = platform_grid
+        self.gravity = gravity
+        # x is the middle of the player and y its feet, the box reaches from x + left to x + right and up by height
+        self.left, self.right, self.height = player
+        # Nothing falls further than the bottom of the map and a few tiles more
+        self.floor = -4 * platform_grid.cell_size
+
+    def overlaps(self, x, y):
+        """Boxes of the platforms the player's box touches when its feet are at x, y"""
+
+        grid = self.grid
+        size = grid.cell_size
+        left = x + self.left
+        right = x + self.right
+        top = y + self.height
+        hits = []
+        for row in range(max(0, math.floor(y / size)), min(grid.rows, math.floor(top / size) + 1)):
+            for column in range(max(0, math.floor(left / size)), min(grid.columns, math.floor(right / size) + 1)):
+                box = grid.boxes[row, column]
+                # Empty cells are NaN and never compare as overlapping
+                if left < box[1] and right > box[0] and y < box[3] and top > box[2]:
+                    hits.append((column, row, box))
+        return hits
+
+    def move_x(self, x, y, start_y, change_x):
+        """
+        Where the sideways part of a tick ends, the way arcade's engine does it:
+        the whole way when it is free, else up a ramp as high as the move is
+        long, else as many whole pixels as fit. start_y is y before the tick.
+        """
+
+        if not change_x:
+            return x, y
+        direction = math.copysign(1, change_x)
+        distance = upper = abs(change_x)
+        lower = 0
+        lift = 0
+        while True:
+            if not self.overlaps(x + distance * direction, y):
+                lower = distance
+                if upper - lower <= 0:
+                    break
+                distance = (upper + lower) // 2 + (upper + lower) % 2
+                continue
+
+            # Blocked, a step no higher than the move is walked up
+            lift = distance
+            if self.overlaps(x + distance * direction, start_y + lift):
+                lift = 0
+                upper = distance - 1
+                if upper - lower <= 0:
+                    distance = lower
+                    break
+                distance = (upper + lower) // 2
+                continue
+            while lift > 0 and not self.overlaps(x + distance * direction, y + lift - 1):
+                lift -= 1
+            break
+        return x + distance * direction, y + lift
+
+    def arc(self, x, y, change_x, change_y):
+        """
+        Points passed through from a start until landing, and the (column, row)
+        landed on, or None when the arc never lands.
+        """
+
+        points = [(x, y)]
+        for _ in range(MAX_ARC_TICKS):
+            start_y = y
+            change_y -= self.gravity
+            y += change_y
+            landed = None
+            hits = self.overlaps(x, y)
+            if hits:
+                if change_y < 0:
+                    column, row, box = max(hits, key=lambda hit: hit[2][3])
+                    # The engine lifts the player out of the ground in quarter pixels
+                    y = round(y + math.ceil((box[3] - y) / LANDING_STEP) * LANDING_STEP, 2)
+                    landed = (column, row)
+                else:
+                    # Bumped a ceiling, the engine stops the rise there
+                    y = min(hit[2][2] for hit in hits) - self.height
+                    change_y = 0
+            # The engine still moves sideways on the tick it lands
+            x, y = self.move_x(x, y, start_y, change_x)
+            points.append((x, y))
+            if landed is not None:
+                return points, landed
+            if y < self.floor:
+                return points, None
+        return points, None
+
+
+def build_navigation(platform_grid, gravity, jump_speed, move_speed, player):
+    """Work out the navigation graph of a PlatformGrid, player is the box from player_box()"""
+
+    grid = platform_grid
+    size = grid.cell_size
+    body = _Body(grid, gravity, player)
+
+    # A node is a platform whose top the player fits on
+    nodes = []
+    for row in range(grid.rows):
+        for column in range(grid.columns):
+            box = grid.boxes[row, column]
+            if np.isnan(box[0]):
+                continue
+            x = (column + 0.5) * size
+            if box[0] <= x <= box[1] and not body.overlaps(x, box[3] + 0.01):
+                nodes.append((column, row, x, float(box[3])))
+    node_at_cell = {(column, row): index for index, (column, row, _, _) in enumerate(nodes)}
+
+    # Per node list of (target, kind, ticks, points), only the quickest move to each target is kept
+    moves = [dict() for _ in nodes]
+
+    def add(source, target, kind, points):
+        if target == source:
+            return
+        ticks = len(points) - 1
+        if target not in moves[source] or ticks < moves[source][target][1]:
+            moves[source][target] = (kind, ticks, points)
+
+    for source, (column, row, x, y) in enumerate(nodes):
+        box = grid.boxes[row, column]
+        for direction in (-1, 1):
+            # Walking onto the next tile at the same height
+            neighbour = node_at_cell.get((column + direction, row))
+            if neighbour is not None and grid.boxes[row, column + direction][3] == box[3]:
+                steps = max(1, math.ceil(size / move_speed))
+                points = [(x + direction * size * step / steps, y) for step in range(steps + 1)]
+                add(source, neighbour, WALK, points)
+            else:
+                # Walking off the edge, starting where the player's box has just left the tile
+                start_x = box[1] - body.left + 1 if direction > 0 else box[0] - body.right - 1
+                if not body.overlaps(start_x, y):
+                    points, landed = body.arc(start_x, y, direction * move_speed, 0)
+                    target = node_at_cell.get(landed) if landed else None
+                    if target is not None:
+                        add(source, target, FALL, [(x, y)] + points)
+
+            # Running jumps from the middle and from both ends of the tile
+            for take_off in (x, box[0] - body.left, box[1] - body.right):
+                points, landed = body.arc(take_off, y, direction * move_speed, jump_speed)
+                target = node_at_cell.get(landed) if landed else None
+                if target is not None:
+                    add(source, target, JUMP, points)
+
+    # Flatten into arrays sorted by source node
+    edge_offsets = [0]
+    edge_target = []
+    edge_kind = []
+    edge_ticks = []
+    point_offsets = [0]
+    points = []
+    for source_moves in moves:
+        for target in sorted(source_moves):
+            kind, ticks, path = source_moves[target]
+            edge_target.append(target)
+            edge_kind.append(kind)
+            edge_ticks.append(ticks)
+            points.extend(path)
+            point_offsets.append(len(points))
+        edge_offsets.append(len(edge_target))
+
+    return NavigationGraph(
+        float(size),
+        np.array([node[2] for node in nodes], dtype=np.float32),
+        np.array([node[3] for node in nodes], dtype=np.float32),
+        np.array([(node[0], node[1]) for node in nodes], dtype=np.int32).reshape(-1, 2),
+        np.array(edge_offsets, dtype=np.int64),
+        np.array(edge_target, dtype=np.int32),
+        np.array(edge_kind, dtype=np.uint8),
+        np.array(edge_ticks, dtype=np.int32),
+        np.array(point_offsets, dtype=np.int64),
+        np.array(points, dtype=np.float32).reshape(-1, 2),
+    )
+
+
+def navigation_path(map_path):
+    """Where the graph of a map is cached, next to the map file"""
+    return str(arcade.resources.resolve(map_path)) + NAVIGATION_EXTENSION
+
+
+def load_navigation(map_path, platform_grid, gravity, jump_speed, move_speed, player):
+    """
+    The navigation graph of a map, read from the file next to it when that
+    was built from the same platforms, constants and player box, built and
+    saved otherwise.
+    """
+
+    digest = hashlib.sha1()
+    digest.update(np.array([NAVIGATION_VERSION, gravity, jump_speed, move_speed, *player,
+                            MAX_ARC_TICKS, platform_grid.cell_size], dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(platform_grid.boxes).tobytes())
+    key = digest.digest()
+
+    path = navigation_path(map_path)
+    graph = NavigationGraph.load(path, key)
+    if graph is not None:
+        return graph
+
+    graph = build_navigation(platform_grid, gravity, jump_speed, move_speed, player)
+    try:
+        graph.save(path, key)
+    except OSError:
+        # Maps in read only places still get a graph, it is just built every time
+        pass
+    return graph
+
+
+def main():
+    """Build a map's navigation graph or find a route on it"""
+
+    parser = argparse.ArgumentParser(description="Navigation graphs for the Platforms layer")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_command = commands.add_parser("build", help="build and cache the graph of a map")
+    build_command.add_argument("map", nargs="?", default=MAP_PATH, help="Tiled map")
+    build_command.add_argument("--force", action="store_true", help="build again even if a cached graph exists")
+
+    path_command = commands.add_parser("path", help="print the quickest route between two positions")
+    path_command.add_argument("map", help="Tiled map")
+    path_command.add_argument("coordinates", type=float, nargs=4, metavar=("START_X", "START_Y", "GOAL_X", "GOAL_Y"))
+
+    args = parser.parse_args()
+
+    level = LevelCache().load_level(args.map, TILE_SCALING, LAYER_OPTIONS)
+
+    if args.command == "build" and args.force and os.path.exists(navigation_path(args.map)):
+        os.remove(navigation_path(args.map))
+
+    start = time.perf_counter()
+    player = player_box(arcade.Sprite(arcade.load_texture(PLAYER_TEXTURE_PATH)))
+    graph = load_navigation(args.map, level.platform_grid, GRAVITY, PLAYER_JUMP_SPEED, PLAYER_MOVEMENT_SPEED, player)
+    elapsed = time.perf_counter() - start
+
+    if args.command == "build":
+        counts = np.bincount(graph.edge_kind, minlength=len(EDGE_KIND_NAMES))
+        kinds = ", ".join(f"{count} {name}" for name, count in zip(EDGE_KIND_NAMES, counts.tolist()))
+        print(f"{len(graph)} nodes, {graph.edge_count} edges ({kinds}) in {elapsed * 1000:.1f} ms")
+        start_node = graph.nearest_node(PLAYER_START_X, PLAYER_START_Y)
+        if start_node is not None:
+            print(f"{len(graph.reachable_from(start_node))} nodes reachable from the player start")
+        return
+
+    start_x, start_y, goal_x, goal_y = args.coordinates
+    start_node = graph.nearest_node(start_x, start_y)
+    goal_node = graph.nearest_node(goal_x, goal_y)
+    if start_node is None or goal_node is None:
+        print("no platform under one of the positions")
+        return
+    path = graph.find_path(start_node, goal_node)
+    if path is None:
+        print("goal cannot be reached")
+        return
+    for edge in path:
+        target = graph.edge_target[edge]
+        print(f"{EDGE_KIND_NAMES[graph.edge_kind[edge]]:<5} to ({graph.node_x[target]:.0f}, {graph.node_y[target]:.0f}) "
+              f"in {graph.edge_ticks[edge]} ticks")
+    print(f"{sum(int(graph.edge_ticks[edge]) for edge in path)} ticks")
+
+
+if __name__ == "__main__":
+    main()
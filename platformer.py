@@ -3,20 +3,42 @@ Platformer Game
 """
 
 # type: ignore
+import argparse
+import os
+
 import arcade
 
+from animation import AnimationSystem
+from asset_loader import AssetLoader
+from audio import NullAudioBackend, SoundManager
+from culling import CulledSceneRenderer, level_chunked_layers
+from hud import Hud
+from profiling import OVERLAY_KEY, Profiler, ProfilerOverlay
+from replay import InputRecorder
+from snapshots import SnapshotRing
+from sprite_atlas import load_monster_atlas
+from world import (COLLISION_DISCRETE, COLLISION_SWEPT, EVENT_COIN, EVENT_JUMP, LAYER_OPTIONS, MAP_PATH,
+                   PLAYER_TEXTURE_PATH, TICK_RATE, TILE_SCALING, GameWorld)
+
 # Constants
 WINDOW_WIDTH = 1280
 WINDOW_HEIGHT = 720
 WINDOW_TITLE = "Platformer"
 
-PLAYER_MOVEMENT_SPEED = 5
-TILE_SCALING = 0.5
-COIN_SCALING = 0.5
+# A snapshot goes in the rewind ring every this many seconds, 64 of them cover about 32 seconds
+SNAPSHOT_INTERVAL = 0.5
+
+# BACKSPACE goes back at least this many seconds
+REWIND_TIME = 2
+
+# Most world steps one frame runs, after a long stall the game slows down for a moment instead of
+# spending every following frame catching up
+MAX_CATCH_UP_STEPS = 5
+
+CHECKPOINT_SAVE_KEY = arcade.key.F5
+CHECKPOINT_LOAD_KEY = arcade.key.F9
+REWIND_KEY = arcade.key.BACKSPACE
 
-# Constant for gravity based 2D games
-GRAVITY = 1
-PLAYER_JUMP_SPEED = 20
 
 class Player(arcade.Sprite):
 
@@ -43,88 +65,119 @@ class GameView(arcade.Window):
     Main application class.
     """
 
-    def __init__(self):
+    def __init__(self, record_path=None, profile_path=None, mute=False, levels=None, tick_rate=TICK_RATE,
+                 collision=COLLISION_DISCRETE):
 
         # Call the parent class to set up the window
         super().__init__(WINDOW_WIDTH, WINDOW_HEIGHT, WINDOW_TITLE)
 
-        # Creates empty variables for sprites and sprites lists to be setup each time game starts
-        self.player_texture = None
+        # Times the stages of every frame, on from the start when the timings are saved on close
+        self.profile_path = profile_path
+        self.profiler = Profiler(enabled=profile_path is not None)
+        # The sound pool's metrics are shown under the timings
+        self.profiler_overlay = ProfilerOverlay(self.profiler, extra_lines=self.sound_lines)
+
+        # Maps played in order, the next one is loaded in the background while the current one is played
+        self.levels = list(levels) if levels else [MAP_PATH]
+        self.level_index = 0
+
+        # All of the game state lives in the world, the window only draws it
+        # The world steps at tick_rate whatever the frame rate is, frames draw between the last two steps
+        self.world = GameWorld(map_path=self.levels[0], profiler=self.profiler, tick_rate=tick_rate, collision=collision)
+        self.snapshot_interval = max(1, round(SNAPSHOT_INTERVAL * tick_rate))
+        self.rewind_ticks = round(REWIND_TIME * tick_rate)
 
-        self.player_sprite = None
+        # Frame time not yet used up by world steps, always less than a step after on_update
+        self.accumulator = 0.0
 
-        self.scene = None
+        # Where the player, camera and enemies were before the last step
+        self.previous_player = (0, 0)
+        self.previous_camera = (0, 0)
+        self.previous_enemy_x = None
+        self.previous_enemy_y = None
+        self.loader = AssetLoader(self.world.level_cache, TILE_SCALING, LAYER_OPTIONS, [PLAYER_TEXTURE_PATH])
 
-        self.tile_map = None
+        # When a record path is given every key change is saved for replay.py
+        self.record_path = record_path
+        self.recorder = InputRecorder(self.world.map_path) if record_path else None
 
         self.camera = None
 
         self.gui_camera = None
 
-        self.score = 0
+        # Draws only the chunks of the static layers the camera can see
+        self.renderer = None
 
-        self.score_text = None
+        # Recent snapshots for rewinding and the checkpoint saved with F5
+        self.snapshots = SnapshotRing()
+        self.checkpoint = None
 
-        # Loading sounds inside __init__ because sound will not change on restart
-        self.collect_coin_sound = arcade.load_sound(":resources:sounds/coin1.wav")
-        self.jump_sound = arcade.load_sound(":resources:sounds/jump1.wav")
+        # Score and title labels, drawn together in one batch
+        self.hud = Hud()
+        self.hud.add_label("title", "Platformer Game", x=WINDOW_WIDTH // 2, y=WINDOW_HEIGHT - 40, anchor_x="center", font_size=24, color=arcade.color.WHITE)
+        self.hud.add_label("score", "Score: {}", 0, x=WINDOW_WIDTH // 2, y=WINDOW_HEIGHT - 70, anchor_x="center", font_size=12, color=arcade.color.WHITE)
+
+        # Every monster animation frame packed into one sheet and put in the GPU atlas once at startup
+        self.monster_atlas = load_monster_atlas()
+        self.monster_atlas.upload(self.ctx.default_atlas)
 
-        # Creates variables the current state of what key is pressed with the default being false
-        self.left_pressed = False
-        self.right_pressed = False
-        self.up_pressed = False
-        self.down_pressed = False
+        # Loading sounds inside __init__ because sound will not change on restart
+        # Headless or muted runs keep the bookkeeping but never touch the mixer
+        backend = NullAudioBackend() if mute or os.environ.get("ARCADE_HEADLESS") else None
+        self.sounds = SoundManager(backend)
+        # A jump is never drowned out by coins, a coin run plays at most two coin sounds at once
+        self.sounds.register(EVENT_COIN, ":resources:sounds/coin1.wav", priority=0, max_concurrent=2)
+        self.sounds.register(EVENT_JUMP, ":resources:sounds/jump1.wav", priority=1, max_concurrent=1)
 
     def setup(self):
         """Set up the game here. Call this function to restart the game."""
 
-        layer_options = {
-            "Platforms": {
-                "use_spatial_hash": True
-            }
-        }
-
-        # Loads in map for game play
-        self.tile_map = arcade.load_tilemap(":resources:tiled_maps/map2_level_1.json", scaling=TILE_SCALING, layer_options=layer_options)
-
-        self.scene = arcade.Scene.from_tilemap(self.tile_map)
-
-        # Loads in a texture to assign to player_texture using Arcades load_texture() method
-        self.player_texture = arcade.load_texture("./Sprites/Pink_Monster/Pink_Monster.png")
-
-        # Uses player_texture and assigns a player sprite using Arcades Sprite() method
-        self.player_sprite = arcade.Sprite(self.player_texture)
-        # Assigns player_sprite a coordinate on game window
-        self.player_sprite.center_x = 64
-        self.player_sprite.center_y = 128
-        # Add player sprite to scene
-        self.scene.add_sprite("Player", self.player_sprite)
-
-        # Assigns player_list a sprite list using Arcades SpriteList() Method
-        self.player_list = arcade.SpriteList()
-        self.player_list.append(self.player_sprite)
-       
-        # The bottom code would be used for a top down experience
-        # Uses Arcades built in simple engine and assigns to all sprite lists inside a physics_engine variable
-        # self.physics_engine = arcade.PhysicsEngineSimple(self.player_sprite, self.wall_list)
-
-        # Uses Arcades built in platformer physics engine and assigns to all sprite lists inside a physics_engine variable
-        # Sets parameter gravity_constant to GRAVITY constant 
-        # Passes wall_list as a walls parameter since arcade supports a walls and platforms parameter
-        self.physics_engine = arcade.PhysicsEnginePlatformer(self.player_sprite, walls=self.scene["Platforms"], gravity_constant=GRAVITY)
+        # Loads the map, player and physics engine
+        self.world.setup()
+
+        # Animates the player from its physics state
+        self.animations = AnimationSystem(self.monster_atlas, self.world.timestep)
+        self.animations.add(self.world.player_sprite, "Pink_Monster")
+
+        # Gives every enemy a sprite, they share one animation system driven by the enemy arrays
+        enemies = self.world.enemies
+        self.enemy_animations = AnimationSystem(self.monster_atlas, self.world.timestep)
+        if "Enemies" in self.world.scene:
+            self.world.scene.remove_sprite_list_by_name("Enemies")
+        self.world.scene.add_sprite_list("Enemies")
+        for index in range(len(enemies)):
+            enemy_sprite = arcade.Sprite()
+            self.enemy_animations.add(enemy_sprite, "Dude_Monster")
+            enemies.attach_sprite(index, enemy_sprite)
+            self.world.scene.add_sprite("Enemies", enemy_sprite)
+
+        # The chunks are kept as long as the cached level hands back the same scene
+        if self.renderer is None or self.renderer.scene is not self.world.scene:
+            # Layers kept as arrays are drawn in their place in the map, between the sprite layers
+            # A preloaded level comes with its chunks already built and uploaded by the asset loader
+            level = self.world.level
+            self.renderer = CulledSceneRenderer(self.world.scene, list(level.layer_names) + ["Player", "Enemies"],
+                                                level_chunked_layers(level), array_layers=level.static_layers)
 
         # Initializes the camera that moves with the move around the player
         self.camera = arcade.Camera2D()
 
         # Initializes the camera that stays stationary around the player
         self.gui_camera = arcade.Camera2D()
-        # Resets score to zero
-        self.score = 0
 
-        # Displays "Score: ..." at the x and y coordinates using the Text() method from the arcade library
-        self.score_text = arcade.Text(f"Score: {self.score}", x=(WINDOW_WIDTH // 2), y=WINDOW_HEIGHT - 70, anchor_x="center", font_size=12, color=arcade.color.WHITE)
-        self.title_text = arcade.Text("Platformer Game", x=WINDOW_WIDTH // 2, y=WINDOW_HEIGHT - 40, anchor_x="center", font_size=24, color=arcade.color.WHITE)
+        # A restart puts the score back to zero, the labels themselves are kept
+        self.hud.set("score", self.world.score)
+
+        # Snapshots from before a restart are of a different run
+        self.snapshots.clear()
+        self.checkpoint = None
 
+        # Nothing to blend from on a new level, the first frame draws where everything starts
+        self.remember_positions()
+
+        next_map = self.next_map()
+        if next_map is not None:
+            self.loader.preload(next_map)
 
         # Sets background color for game window using arcade.csscolor.color
         self.background_color = arcade.csscolor.CORNFLOWER_BLUE
@@ -132,121 +185,251 @@ class GameView(arcade.Window):
     def on_draw(self):
         """Render the screen."""
 
-        # Clears the whole screen to whatever the background color is set to
-        self.clear()
+        profiler = self.profiler
+
+        with profiler.zone("frame.draw"):
+            # Clears the whole screen to whatever the background color is set to
+            self.clear()
+
+            # Moves the player, enemies and camera to where they are between the last two steps
+            with profiler.zone("draw.interpolate"):
+                player_position = self.interpolate()
 
-        # Activates the cameras before drawing
-        self.camera.use()
+            # Activates the cameras before drawing
+            self.camera.use()
 
-        # Draws scene and all its layers
-        self.scene.draw()
+            # Draws the scene layers, static ones only where the camera is looking
+            with profiler.zone("draw.scene"):
+                camera_x, camera_y = self.camera.position
+                self.renderer.draw(camera_x - WINDOW_WIDTH / 2, camera_y - WINDOW_HEIGHT / 2, WINDOW_WIDTH, WINDOW_HEIGHT)
 
-        self.gui_camera.use()
-        # Draws text on screen
-        self.score_text.draw()
-        self.title_text.draw()
+            # The physics engine owns the player's position, it goes back to where the last step left it
+            self.world.player_sprite.position = player_position
 
-        #self.player_list.draw_hit_boxes()
-        #self.wall_list.draw_hit_boxes()
+            self.gui_camera.use()
+            # Draws every HUD label in one batch
+            with profiler.zone("draw.gui"):
+                self.hud.draw()
+
+        # Drawn outside its own zones so showing it does not change the numbers
+        self.profiler_overlay.draw()
 
     def on_update(self, delta_time):
         """Movement and Game Logic"""
 
-        # Updates at a default of 60 FPS with changes in regards to our simple physics engine
-        self.physics_engine.update()
-
-        # Checks for collision betweeen player sprite and coin sprites during each update
-        coin_hit_list = arcade.check_for_collision_with_list(self.player_sprite, self.scene["Coins"])
-
-        # If collision does happen then the coin sprite will be removed from the sprite list
-        for coin in coin_hit_list:  
-            coin.remove_from_sprite_lists()
-            # Play coin collect sound
-            arcade.play_sound(self.collect_coin_sound)
-            # Updates the score to plus one
-            self.score += 1
-            # Updates the text
-            self.score_text.text = f"Score: {self.score}"
-
-        # Updates the cameras postion to center around the player sprite
-        self.camera.position = self.player_sprite.position
-
-    def update_player_speed(self):
-
-        # Calculate speed based on the keys pressed
-        self.player_sprite.change_x = 0
-        self.player_sprite.change_y = 0
-
-        # Goes based off the updating of defined variables in th __init__ method
-        # If up_pressed is TRUE AND down_pressed is FALSE, the y coordinate increases by PLAYER_MOVEMENT_SPEED(5)
-        if self.up_pressed and not self.down_pressed:
-            self.player_sprite.change_y = PLAYER_JUMP_SPEED
-        # If down_pressed is TRUE AND up_pressed is FALSE, the y coordinate decreased by PLAYER_MOVEMENT_SPEED(5)
-        elif self.down_pressed and not self.up_pressed:
-            self.player_sprite.change_y = -PLAYER_MOVEMENT_SPEED
-        # If left_pressed is TRUE AND right_pressed is FALSE, the x coordinate decreases by PLAYER_MOVEMENT_SPEED(5)
-        if self.left_pressed and not self.right_pressed:
-            self.player_sprite.change_x = -PLAYER_MOVEMENT_SPEED
-        # If right_pressed is TRUE AND left_pressed is FALSE, the x coordinate increases by PLAYER_MOVEMENT_SPEED(5)
-        elif self.right_pressed and not self.left_pressed:
-            self.player_sprite.change_x = PLAYER_MOVEMENT_SPEED
+        profiler = self.profiler
+
+        with profiler.zone("frame.update"):
+            # Runs as many fixed steps as the frame time covers, a fast display runs none on some frames
+            timestep = self.world.timestep
+            self.accumulator += delta_time
+            steps = 0
+            while self.accumulator >= timestep and steps < MAX_CATCH_UP_STEPS:
+                self.remember_positions()
+                self.world.step()
+                if self.recorder:
+                    self.recorder.advance()
+
+                self.play_events()
+
+                if self.can_snapshot() and self.world.tick % self.snapshot_interval == 0:
+                    self.snapshots.push(self.world.snapshot())
+
+                self.accumulator -= timestep
+                steps += 1
+
+            # Time the cap left over is dropped rather than owed to later frames
+            if self.accumulator >= timestep:
+                self.accumulator %= timestep
+
+            with profiler.zone("view.animation"):
+                # Picks the player's animation frame from whether it is on the ground and how it moves
+                self.animations.update_sprites(delta_time, [self.world.physics_engine.can_jump()])
+
+                # Enemies are animated straight from their arrays, only the ones drawn last frame get a texture
+                enemies = self.world.enemies
+                if len(enemies):
+                    self.enemy_animations.update(delta_time, enemies.on_ground, enemies.change_x, enemies.change_y,
+                                                 visible=enemies.was_visible)
+
+            # Lays out the labels whose value changed this frame
+            self.hud.flush()
+
+        # Uploads a little of the next level each frame
+        with profiler.zone("assets.upload"):
+            self.loader.update()
+
+        # Every coin collected moves on to the next level once it has finished loading
+        # A recording only holds one map, so levels are not switched while recording
+        next_map = self.next_map()
+        # Compared with the level's total since a streamed level's grid only holds the loaded chunks' coins
+        coin_total = self.world.level.pickup_counts.get("Coins")
+        level_done = coin_total is not None and self.world.score >= coin_total
+        if level_done and next_map is not None and self.recorder is None and self.loader.is_ready(next_map):
+            previous_map = self.world.map_path
+            self.level_index += 1
+            self.world.map_path = next_map
+            self.setup()
+            # The level just left is not needed again unless it comes up later in the list
+            if previous_map not in self.levels[self.level_index:]:
+                self.world.level_cache.evict(previous_map)
+
+        self.profiler_overlay.update(delta_time)
+
+    def sound_lines(self):
+        """Voice pool metrics for the F3 overlay"""
+        metrics = self.sounds.metrics()
+        return ["",
+                f"sound voices {metrics['voices']} (peak {metrics['peak_voices']})",
+                f"played {metrics['played']}, merged {metrics['deduplicated']}, "
+                f"dropped {metrics['dropped']}, stolen {metrics['stolen']}"]
+
+    def next_map(self):
+        """Map after the current one, None on the last level"""
+        if self.level_index + 1 < len(self.levels):
+            return self.levels[self.level_index + 1]
+        return None
+
+    def can_snapshot(self):
+        """Streamed levels cannot be snapshotted, and a recording only holds key presses so going back is off while recording"""
+        return not self.world.level.streamed and self.recorder is None
+
+    def restore(self, snapshot):
+        """Jump the world back to a snapshot and refresh what is shown from it"""
+
+        self.world.restore(snapshot)
+        self.snapshots.discard_after(snapshot.tick)
+        self.hud.set("score", self.world.score)
+        # A jump back in time is drawn as a cut, not blended
+        self.remember_positions()
+
+    def remember_positions(self):
+        """Keep where things are before a step, frames are drawn between these and where the step leaves them"""
+
+        world = self.world
+        self.previous_player = world.player_sprite.position
+        self.previous_camera = world.camera_position
+        # Copies, the enemy update moves the arrays in place
+        self.previous_enemy_x = world.enemies.x.copy()
+        self.previous_enemy_y = world.enemies.y.copy()
+
+    def interpolate(self):
+        """
+        Move the player sprite, camera and on screen enemy sprites part of
+        the way from their previous positions to their current ones, as far
+        as the leftover frame time is into the next step. Returns the
+        player's real position so it can be put back after drawing.
+        """
+
+        world = self.world
+        alpha = self.accumulator / world.timestep
+
+        player = world.player_sprite
+        player_position = player.position
+        previous_x, previous_y = self.previous_player
+        player.position = (previous_x + (player_position[0] - previous_x) * alpha,
+                           previous_y + (player_position[1] - previous_y) * alpha)
+
+        previous_x, previous_y = self.previous_camera
+        camera_x, camera_y = world.camera_position
+        camera_x = previous_x + (camera_x - previous_x) * alpha
+        camera_y = previous_y + (camera_y - previous_y) * alpha
+        self.camera.position = (camera_x, camera_y)
+
+        # Only the enemies on screen get their sprite moved
+        enemies = world.enemies
+        if len(enemies):
+            enemy_x = self.previous_enemy_x + (enemies.x - self.previous_enemy_x) * alpha
+            enemy_y = self.previous_enemy_y + (enemies.y - self.previous_enemy_y) * alpha
+            enemies.sync_sprites(camera_x - WINDOW_WIDTH / 2, camera_y - WINDOW_HEIGHT / 2, WINDOW_WIDTH, WINDOW_HEIGHT,
+                                 enemy_x, enemy_y, self.enemy_animations)
+
+        return player_position
+
+    def play_events(self):
+        """Play sounds and refresh text for whatever happened in the world"""
+
+        events = self.world.pop_events()
+
+        # Events are named after their sound, several coins in one tick start one voice
+        for event in events:
+            self.sounds.play(event)
+        self.sounds.update()
+
+        # Only queues the new score, the label is laid out at most once per tick by the HUD
+        if EVENT_COIN in events:
+            self.hud.set("score", self.world.score)
 
     def on_key_press(self, key, modifiers):
         """Called whenever a key is pressed."""
 
+        if self.recorder:
+            self.recorder.press(key)
+
         if key == arcade.key.ESCAPE:
+            self.sounds.stop_all()
             self.setup()
 
-        # If key pressed is equal to UP arrow key, update up_pressed variable in __init__ to TRUE
-        if key == arcade.key.UP:
-            # Checks if player_sprite is touching ground or not
-            if self.physics_engine.can_jump():
-                self.up_pressed = True
-                # Calls update_player_speed() in parent superclass
-                self.update_player_speed()
-                # Plays jump sound
-                arcade.play_sound(self.jump_sound)
-        # If key pressed is equal to DOWN arrow key, update down_pressed variable in __init__ to TRUE
-        elif key == arcade.key.DOWN:
-            self.down_pressed = True
-            # Calls update_player_speed() in parent superclass
-            self.update_player_speed()
-        # If key pressed is equal to LEFT arrow key, update left_pressed variable in __init__ to TRUE
-        elif key == arcade.key.LEFT:
-            # Calls update_player_speed() in parent superclass
-            self.left_pressed = True
-            self.update_player_speed()
-        # If key pressed is equal to RIGHT arrow key, update right_pressed variable in __init__ to TRUE
-        elif key == arcade.key.RIGHT:
-            # Calls update_player_speed() in parent superclass
-            self.right_pressed = True
-            self.update_player_speed()
+        if key == OVERLAY_KEY:
+            self.profiler_overlay.toggle()
+
+        if self.can_snapshot():
+            if key == CHECKPOINT_SAVE_KEY:
+                self.checkpoint = self.world.snapshot()
+            elif key == CHECKPOINT_LOAD_KEY and self.checkpoint is not None:
+                self.restore(self.checkpoint)
+            elif key == REWIND_KEY:
+                snapshot = self.snapshots.at_or_before(self.world.tick - self.rewind_ticks)
+                if snapshot is not None:
+                    self.restore(snapshot)
+
+        self.world.on_key_press(key)
+
+        # Jumps are heard right away instead of on the next update
+        self.play_events()
 
     def on_key_release(self, key, modifiers):
         """Called whenever a key is released."""
-        """Changes are set to zero since change will happen on press and not on release"""
-
-        # After releasing UP key set the up_pressed variable in the __init__ method to FALSE
-        if key == arcade.key.UP:
-            self.up_pressed = False
-            self.update_player_speed()
-        # After releasing DOWN key set the up_pressed variable in the __init__ method to FALSE
-        elif key == arcade.key.DOWN:
-            self.down_pressed = False
-            self.update_player_speed()
-        # After releasing LEFT key set the up_pressed variable in the __init__ method to FALSE
-        elif key == arcade.key.LEFT:
-            self.left_pressed = False
-            self.update_player_speed()
-        # After releasing RIGHT key set the up_pressed variable in the __init__ method to FALSE
-        elif key == arcade.key.RIGHT:
-            self.right_pressed = False
-            self.update_player_speed()
+
+        if self.recorder:
+            self.recorder.release(key)
+
+        self.world.on_key_release(key)
+
+    def on_close(self):
+        """Saves the recording, if there is one, before the window closes"""
+
+        if self.recorder:
+            self.recorder.save(self.record_path, self.world.state_hash())
+
+        if self.profile_path:
+            self.profiler.export(self.profile_path)
+
+        self.loader.close()
+
+        super().on_close()
 
 
 def main():
     """Main function"""
-    window = GameView()
+    parser = argparse.ArgumentParser(description="Platformer Game")
+    parser.add_argument("--record", help="save every key press to this file for replay.py")
+    parser.add_argument("--profile", help="save per stage frame timings to this .csv or .json file on close")
+    parser.add_argument("--mute", action="store_true", help="play no sounds")
+    parser.add_argument("--levels", nargs="+", help="maps to play in order, collecting every coin moves on to the next")
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE, help="world steps per second, independent of the frame rate")
+    parser.add_argument("--collision", choices=[COLLISION_DISCRETE, COLLISION_SWEPT], default=COLLISION_DISCRETE,
+                        help="how the player collides with platforms and coins")
+    args = parser.parse_args()
+
+    # replay.py steps its world at the default rate, so a recording has to be made at it
+    if args.record and args.tick_rate != TICK_RATE:
+        parser.error(f"recordings are made at {TICK_RATE} ticks per second, leave out --tick-rate")
+    if args.record and args.collision != COLLISION_DISCRETE:
+        parser.error(f"recordings are made with {COLLISION_DISCRETE} collision, leave out --collision")
+
+    window = GameView(record_path=args.record, profile_path=args.profile, mute=args.mute, levels=args.levels,
+                      tick_rate=args.tick_rate, collision=args.collision)
     window.setup()
     arcade.run()
 
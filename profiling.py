@@ -0,0 +1,199 @@
+"""
+Profiling
+
+Named timing zones around the stages of a frame. Each zone keeps the times
+of its last ROLLING_FRAMES runs, so p50/p95/p99 always describe recent play,
+and the summary can be written as CSV or JSON from headless runs too.
+ProfilerOverlay draws the same numbers on screen, toggled with F3.
+
+    with profiler.zone("physics"):
+        physics_engine.update()
+"""
+
+# type: ignore
+import csv
+import json
+import time
+from collections import deque
+
+import arcade
+
+# Constants
+# Number of recent runs each zone keeps
+ROLLING_FRAMES = 600
+
+# How often the overlay text is laid out again, in seconds
+OVERLAY_REFRESH = 0.5
+
+OVERLAY_KEY = arcade.key.F3
+
+
+def percentile(sorted_values, fraction):
+    """Nearest rank percentile of an already sorted list"""
+
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class _Zone:
+    """
+    Context manager that adds the time spent inside it to one zone.
+    """
+
+    __slots__ = ("samples", "start")
+
+    def __init__(self, samples):
+        self.samples = samples
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.samples.append(time.perf_counter() - self.start)
+        return False
+
+
+class _NoZone:
+    """
+    Stand-in zone used while profiling is off.
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_ZONE = _NoZone()
+
+
+class Profiler:
+    """
+    Rolling timings for named zones.
+    """
+
+    def __init__(self, enabled=True, rolling_frames=ROLLING_FRAMES):
+
+        self.enabled = enabled
+        self.rolling_frames = rolling_frames
+
+        # Maps a zone name to the deque of its recent times in seconds, in first use order
+        self.samples = {}
+        self._zones = {}
+
+    def zone(self, name):
+        """Context manager timing one run of a zone"""
+
+        if not self.enabled:
+            return _NO_ZONE
+
+        zone = self._zones.get(name)
+        if zone is None:
+            samples = deque(maxlen=self.rolling_frames)
+            self.samples[name] = samples
+            zone = _Zone(samples)
+            self._zones[name] = zone
+        return zone
+
+    def clear(self):
+        """Forget every sample"""
+        for samples in self.samples.values():
+            samples.clear()
+
+    def summary(self):
+        """Per zone count, mean, p50, p95, p99 and max, all in milliseconds"""
+
+        rows = []
+        for name, samples in self.samples.items():
+            values = sorted(samples)
+            count = len(values)
+            rows.append({
+                "zone": name,
+                "count": count,
+                "mean_ms": sum(values) / count * 1000 if count else 0.0,
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "max_ms": values[-1] * 1000 if count else 0.0,
+            })
+        return rows
+
+    def export(self, path):
+        """Write the summary to path, as CSV when it ends in .csv and JSON otherwise"""
+
+        rows = self.summary()
+        if path.endswith(".csv"):
+            with open(path, "w", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=["zone", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"])
+                writer.writeheader()
+                writer.writerows(rows)
+        else:
+            with open(path, "w") as file:
+                json.dump(rows, file, indent=2)
+
+
+class ProfilerOverlay:
+    """
+    On screen table of the profiler's zones, drawn with the GUI camera.
+    """
+
+    def __init__(self, profiler, x=10, top=None, font_size=10, extra_lines=None):
+
+        self.profiler = profiler
+        self.visible = False
+
+        # Called on every refresh for more lines under the zones, like the sound metrics
+        self.extra_lines = extra_lines
+
+        self.x = x
+        self.top = top
+        self.font_size = font_size
+
+        self.texts = []
+        self.since_refresh = OVERLAY_REFRESH
+
+    def toggle(self):
+        """Show or hide the overlay, showing it also switches timing on"""
+        self.visible = not self.visible
+        if self.visible:
+            self.profiler.enabled = True
+        self.since_refresh = OVERLAY_REFRESH
+
+    def update(self, delta_time):
+        """Lay the text out again every OVERLAY_REFRESH seconds instead of every frame"""
+
+        if not self.visible:
+            return
+        self.since_refresh += delta_time
+        if self.since_refresh < OVERLAY_REFRESH:
+            return
+        self.since_refresh = 0.0
+
+        lines = [f"{'zone (ms)':<18} {'p50':>7} {'p95':>7} {'p99':>7}"]
+        for row in self.profiler.summary():
+            lines.append(f"{row['zone']:<18} {row['p50_ms']:7.3f} {row['p95_ms']:7.3f} {row['p99_ms']:7.3f}")
+        if self.extra_lines is not None:
+            lines.extend(self.extra_lines())
+
+        line_height = self.font_size * 1.6
+        top = self.top if self.top is not None else arcade.get_window().height - 10
+        # Text objects are reused and only grow in number when zones are added
+        while len(self.texts) < len(lines):
+            self.texts.append(arcade.Text("", x=self.x, y=0, font_size=self.font_size,
+                                          font_name=("Courier New", "Courier", "monospace"), color=arcade.color.WHITE))
+        for index, text in enumerate(self.texts):
+            text.text = lines[index] if index < len(lines) else ""
+            text.y = top - (index + 1) * line_height
+
+    def draw(self):
+        if not self.visible:
+            return
+        for text in self.texts:
+            text.draw()
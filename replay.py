@@ -0,0 +1,204 @@
+"""
+Input Recording and Replay
+
+Records key presses and releases against the frame they happened on and
+writes them to a small binary file. A recording can be fed back through the
+same GameWorld key handlers without a window, which makes it a repeatable
+benchmark and a check that the simulation still ends in the same state.
+
+File layout (little endian):
+    header   magic "PREC", version (u16), frame count (u32), event count (u32),
+             final state hash (20 bytes), map path length (u16), map path (utf-8)
+    events   frame (u32), pressed (u8), key (u64) for each event
+
+Version 1 files stored the key as a u32 and can still be read. Keys are u64
+because pyglet numbers keys without a symbol by their scancode shifted up by
+32 bits.
+"""
+
+# type: ignore
+import argparse
+import struct
+import time
+
+import arcade
+
+from profiling import percentile
+from world import MAP_PATH, GameWorld
+
+# Constants
+MAGIC = b"PREC"
+VERSION = 2
+
+HEADER = struct.Struct("<4sHII20sH")
+EVENT = struct.Struct("<IBQ")
+
+# Event layout of every version that can be loaded
+EVENTS = {1: struct.Struct("<IBI"), 2: EVENT}
+
+# How often the replay writes down a state hash while running
+HASH_INTERVAL = 600
+
+
+class InputRecorder:
+    """
+    Collects key transitions per frame while a world is being played.
+    """
+
+    def __init__(self, map_path=MAP_PATH):
+
+        self.map_path = map_path
+
+        # Number of world steps seen so far, key events are stamped with it
+        self.frame = 0
+
+        # List of (frame, pressed, key)
+        self.events = []
+
+    def press(self, key):
+        """Record a key going down on the current frame"""
+        self.events.append((self.frame, 1, key))
+
+    def release(self, key):
+        """Record a key going up on the current frame"""
+        self.events.append((self.frame, 0, key))
+
+    def advance(self):
+        """Call once after every world step"""
+        self.frame += 1
+
+    def save(self, path, final_hash=b"\0" * 20):
+        """Write the recording to path"""
+
+        map_path = self.map_path.encode("utf-8")
+
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.frame, len(self.events), final_hash, len(map_path)))
+            file.write(map_path)
+            for event in self.events:
+                file.write(EVENT.pack(*event))
+
+
+class Recording:
+    """
+    A recording loaded back from disk.
+    """
+
+    def __init__(self, map_path, frame_count, events, final_hash):
+        self.map_path = map_path
+        self.frame_count = frame_count
+        self.events = events
+        self.final_hash = final_hash
+
+    @classmethod
+    def load(cls, path):
+        """Read a recording written by InputRecorder.save()"""
+
+        with open(path, "rb") as file:
+            data = file.read()
+
+        magic, version, frame_count, event_count, final_hash, path_length = HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an input recording")
+        if version not in EVENTS:
+            raise ValueError(f"{path} has recording version {version}, expected {VERSION}")
+        event_struct = EVENTS[version]
+
+        offset = HEADER.size
+        map_path = data[offset:offset + path_length].decode("utf-8")
+        offset += path_length
+
+        events = [event for event in event_struct.iter_unpack(data[offset:offset + event_count * event_struct.size])]
+
+        return cls(map_path, frame_count, events, final_hash)
+
+
+def apply_event(world, pressed, key):
+    """Feed one recorded key change to a world the way the game window handled it"""
+
+    # ESC restarts the level in the game, its release does nothing
+    if key == arcade.key.ESCAPE:
+        if pressed:
+            world.setup()
+    elif pressed:
+        world.on_key_press(key)
+    else:
+        world.on_key_release(key)
+
+
+def replay(recording, world=None):
+    """
+    Run a recording through a world and return a report dict with frames per
+    second, p50/p99 step cost in milliseconds and the state hashes.
+    """
+
+    if world is None:
+        world = GameWorld(map_path=recording.map_path)
+    world.setup()
+
+    # Events are stored in frame order so one pointer walks through them
+    events = recording.events
+    next_event = 0
+
+    step_times = []
+    hashes = []
+
+    def apply_events(frame, next_event):
+        """Feed in the keys that changed before this frame's step"""
+        while next_event < len(events) and events[next_event][0] == frame:
+            _, pressed, key = events[next_event]
+            apply_event(world, pressed, key)
+            next_event += 1
+        return next_event
+
+    start = time.perf_counter()
+    for frame in range(recording.frame_count):
+
+        next_event = apply_events(frame, next_event)
+
+        step_start = time.perf_counter()
+        world.step()
+        step_times.append(time.perf_counter() - step_start)
+
+        world.events.clear()
+
+        if (frame + 1) % HASH_INTERVAL == 0:
+            hashes.append(world.state_hash())
+
+    elapsed = time.perf_counter() - start
+
+    # Keys pressed after the last step still changed the player's speed
+    apply_events(recording.frame_count, next_event)
+
+    step_times.sort()
+    final_hash = world.state_hash()
+
+    return {
+        "frames": recording.frame_count,
+        "frames_per_second": recording.frame_count / elapsed if elapsed else float("inf"),
+        "p50_ms": percentile(step_times, 0.50) * 1000,
+        "p99_ms": percentile(step_times, 0.99) * 1000,
+        "hashes": [value.hex() for value in hashes],
+        "final_hash": final_hash.hex(),
+        "matches_recording": recording.final_hash == final_hash,
+    }
+
+
+def main():
+    """Replay a recording headless and print the benchmark report"""
+    parser = argparse.ArgumentParser(description="Replay an input recording without a window")
+    parser.add_argument("recording", help="file written by python platformer.py --record")
+    parser.add_argument("--repeat", type=int, default=1, help="number of times to run the replay")
+    args = parser.parse_args()
+
+    recording = Recording.load(args.recording)
+
+    for run in range(args.repeat):
+        report = replay(recording)
+        print(f"run {run + 1}: {report['frames']} frames, {report['frames_per_second']:.0f} frames/s, "
+              f"p50 {report['p50_ms']:.3f} ms, p99 {report['p99_ms']:.3f} ms, "
+              f"final hash {report['final_hash']}, matches recording: {report['matches_recording']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Snapshots
+
+Saves and restores the state of a GameWorld without reloading the level.
+A snapshot is a few flat NumPy arrays: the player's position and speed, the
+score, tick and key flags, the enemy arrays, and per pickup layer a bitset
+of which pickups are gone. Sprites themselves are never copied, restoring
+puts the player back and adds or removes only the pickups that differ, so it
+takes a fraction of a millisecond.
+
+SnapshotRing keeps the most recent snapshots for rewinding, and the same
+snapshots can be kept as checkpoints or used to run a replay again from the
+middle.
+
+Only fully loaded levels can be snapshotted, a streamed level's pickups come
+and go with its chunks.
+"""
+
+# type: ignore
+import numpy as np
+
+# Constants
+# Snapshots a SnapshotRing holds before the oldest is dropped
+RING_CAPACITY = 64
+
+# Pickups that may change before restore rebuilds a layer instead of moving them one by one,
+# arcade's insert and remove each shift the whole list
+MAX_IN_PLACE_CHANGES = 100
+
+# Key flags in the order they are packed
+KEY_FLAGS = ("left_pressed", "right_pressed", "up_pressed", "down_pressed")
+
+# Enemy arrays a snapshot copies, the rest do not change after spawning
+ENEMY_FLOAT_ARRAYS = ("x", "y", "change_x", "change_y", "direction")
+ENEMY_BOOL_ARRAYS = ("on_ground", "alive")
+
+
+class WorldSnapshot:
+    """
+    The state of a world at one tick.
+    """
+
+    def __init__(self, player, counters, keys, enemy_floats, enemy_bools, removed):
+
+        # x, y, change_x, change_y
+        self.player = player
+        # score, tick, jumps_since_ground
+        self.counters = counters
+        self.keys = keys
+        # One row per array in ENEMY_FLOAT_ARRAYS and ENEMY_BOOL_ARRAYS
+        self.enemy_floats = enemy_floats
+        self.enemy_bools = enemy_bools
+        # Maps a pickup layer name to the packed bits of its removed pickups, in map order
+        self.removed = removed
+
+    @property
+    def tick(self):
+        return int(self.counters[1])
+
+    def nbytes(self):
+        """Memory the snapshot's arrays use"""
+        arrays = [self.player, self.counters, self.keys, self.enemy_floats, self.enemy_bools]
+        return sum(array.nbytes for array in arrays) + sum(bits.nbytes for bits in self.removed.values())
+
+    @classmethod
+    def capture(cls, world):
+        """Snapshot a world"""
+
+        level = world.level
+        if level.streamed:
+            raise ValueError("snapshots need a fully loaded level, streamed levels cannot be snapshotted")
+
+        player = world.player_sprite
+        enemies = world.enemies
+
+        # The index keeps which pickups are gone in map order, the same order as initial_pickups
+        removed = {name: np.packbits(world.collectibles[name].removed) for name in level.initial_pickups}
+
+        return cls(
+            np.array([player.center_x, player.center_y, player.change_x, player.change_y], dtype=np.float64),
+            np.array([world.score, world.tick, world.physics_engine.jumps_since_ground], dtype=np.int64),
+            np.array([getattr(world, flag) for flag in KEY_FLAGS], dtype=bool),
+            np.array([getattr(enemies, name) for name in ENEMY_FLOAT_ARRAYS], dtype=np.float64).reshape(len(ENEMY_FLOAT_ARRAYS), -1),
+            np.array([getattr(enemies, name) for name in ENEMY_BOOL_ARRAYS], dtype=bool).reshape(len(ENEMY_BOOL_ARRAYS), -1),
+            removed,
+        )
+
+    def restore(self, world):
+        """Put a world back in this snapshot's state, it must be playing the level the snapshot came from"""
+
+        player = world.player_sprite
+        player.center_x, player.center_y, player.change_x, player.change_y = self.player.tolist()
+        world.score, world.tick, world.physics_engine.jumps_since_ground = self.counters.tolist()
+        for flag, value in zip(KEY_FLAGS, self.keys.tolist()):
+            setattr(world, flag, value)
+
+        enemies = world.enemies
+        for name, row in zip(ENEMY_FLOAT_ARRAYS, self.enemy_floats):
+            getattr(enemies, name)[:] = row
+        for name, row in zip(ENEMY_BOOL_ARRAYS, self.enemy_bools):
+            getattr(enemies, name)[:] = row
+
+        level = world.level
+        for name, sprites in level.initial_pickups.items():
+            index = world.collectibles[name]
+            removed = np.unpackbits(self.removed[name], count=len(sprites)).astype(bool)
+
+            # Only the pickups collected or put back since the snapshot are touched
+            changed = np.flatnonzero(index.removed ^ removed)
+            if not len(changed):
+                continue
+
+            sprite_list = world.scene[name]
+            if len(changed) > MAX_IN_PLACE_CHANGES:
+                for position in changed.tolist():
+                    if removed[position]:
+                        index.remove(sprites[position])
+                    else:
+                        index.add(sprites[position])
+                sprite_list.clear()
+                sprite_list.extend(sprites[position] for position in np.flatnonzero(~removed).tolist())
+                continue
+
+            put_back = []
+            for position in changed.tolist():
+                if removed[position]:
+                    sprite = sprites[position]
+                    index.remove(sprite)
+                    sprite.remove_from_sprite_lists()
+                else:
+                    put_back.append(position)
+
+            # Returned pickups go back at their place in map order so the layer looks as it did at the snapshot,
+            # going from first to last every pickup before one is already where it should be
+            if put_back:
+                places = np.cumsum(~removed) - 1
+                for position in put_back:
+                    sprite = sprites[position]
+                    index.add(sprite)
+                    sprite_list.insert(int(places[position]), sprite)
+                # insert() does not mark arcade's index buffer as changed unless it grew, a swap in place does
+                sprite_list.swap(0, 0)
+
+        world.events.clear()
+        world.camera_position = player.position
+
+
+class SnapshotRing:
+    """
+    The last few snapshots of a world, oldest first.
+    """
+
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.snapshots = [None] * capacity
+        # Slot the next snapshot goes in and how many slots are filled
+        self.head = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, snapshot):
+        """Store a snapshot, dropping the oldest one when full"""
+        self.snapshots[self.head] = snapshot
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def latest(self):
+        """The newest snapshot, None when empty"""
+        if not self.count:
+            return None
+        return self.snapshots[(self.head - 1) % self.capacity]
+
+    def at_or_before(self, tick):
+        """The newest snapshot taken at or before a tick, None if there is none that old"""
+
+        for back in range(1, self.count + 1):
+            snapshot = self.snapshots[(self.head - back) % self.capacity]
+            if snapshot.tick <= tick:
+                return snapshot
+        return None
+
+    def discard_after(self, tick):
+        """Forget snapshots newer than a tick, for after rewinding past them"""
+
+        while self.count and self.latest().tick > tick:
+            self.head = (self.head - 1) % self.capacity
+            self.snapshots[self.head] = None
+            self.count -= 1
+
+    def clear(self):
+        self.snapshots = [None] * self.capacity
+        self.head = 0
+        self.count = 0
@@ -0,0 +1,221 @@
+"""
+Sprite Atlas
+
+Builds one sprite sheet holding every animation frame of the monsters in
+Sprites/. The strip sheets there keep their frame count in the file name,
+Pink_Monster_Run_6.png is the Run animation of Pink_Monster with 6 frames
+laid out left to right. Each strip is cut into frames and the frames are
+packed into a single image, which is saved next to a small JSON index so
+later startups can skip the packing.
+
+The frames all come from that one image, and upload() puts them in the GPU
+atlas at startup so drawing an animation never loads a texture mid game.
+
+Usage:
+    python sprite_atlas.py            prints the build report
+    python sprite_atlas.py --rebuild  ignores the cache on disk
+"""
+
+# type: ignore
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+
+import arcade
+from PIL import Image
+
+# Constants
+SPRITES_DIR = "./Sprites"
+ATLAS_CACHE_DIR = "./.atlas_cache"
+ATLAS_IMAGE_NAME = "monster_atlas.png"
+ATLAS_INDEX_NAME = "monster_atlas.json"
+
+# Width of the packed sheet, rows are added until every frame fits
+ATLAS_WIDTH = 512
+
+# Empty pixels between frames so texture filtering never bleeds between them
+FRAME_PADDING = 1
+
+# Pink_Monster_Run_6.png -> character "Pink_Monster", clip "Run", 6 frames
+STRIP_PATTERN = re.compile(r"^(?P<character>.+_Monster)_(?P<clip>[^_]+)_(?P<frames>\d+)\.png$")
+
+
+def find_strips(sprites_dir=SPRITES_DIR):
+    """Return (character, clip, frame count, path) for every strip sheet, sorted by path"""
+
+    strips = []
+    for folder in sorted(os.listdir(sprites_dir)):
+        folder_path = os.path.join(sprites_dir, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for file_name in sorted(os.listdir(folder_path)):
+            match = STRIP_PATTERN.match(file_name)
+            # Dust effects and rocks are not character animations
+            if match is None:
+                continue
+            strips.append((match["character"], match["clip"], int(match["frames"]), os.path.join(folder_path, file_name)))
+    return strips
+
+
+def _source_key(strips):
+    """Hash of the strip paths, sizes and change times, the cache is only used when it matches"""
+
+    digest = hashlib.sha1()
+    for _, _, frames, path in strips:
+        stat = os.stat(path)
+        digest.update(f"{path}|{frames}|{stat.st_size}|{stat.st_mtime_ns}\n".encode("utf-8"))
+    digest.update(f"{ATLAS_WIDTH}|{FRAME_PADDING}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def pack_strips(strips, width=ATLAS_WIDTH, padding=FRAME_PADDING):
+    """
+    Cut every strip into frames and shelf pack them into one RGBA image.
+    Returns the image and {character: {clip: [(x, y, width, height), ...]}}.
+    """
+
+    regions = {}
+    placements = []
+
+    x = 0
+    y = 0
+    shelf_height = 0
+    for character, clip, frame_count, path in strips:
+        strip = Image.open(path).convert("RGBA")
+        frame_width = strip.width // frame_count
+        frame_height = strip.height
+
+        frames = regions.setdefault(character, {}).setdefault(clip, [])
+        for frame in range(frame_count):
+            # Starts a new shelf when the frame does not fit on this one
+            if x + frame_width > width:
+                x = 0
+                y += shelf_height + padding
+                shelf_height = 0
+
+            box = (frame * frame_width, 0, (frame + 1) * frame_width, frame_height)
+            placements.append((strip.crop(box), (x, y)))
+            frames.append((x, y, frame_width, frame_height))
+
+            x += frame_width + padding
+            shelf_height = max(shelf_height, frame_height)
+
+    sheet = Image.new("RGBA", (width, y + shelf_height), (0, 0, 0, 0))
+    for image, position in placements:
+        sheet.paste(image, position)
+
+    return sheet, regions
+
+
+class MonsterAtlas:
+    """
+    The packed sheet plus the frame textures cut from it.
+    """
+
+    def __init__(self, sheet, regions, from_cache):
+
+        self.sheet = sheet
+        self.regions = regions
+
+        # How long loading took, cutting the frame textures included, and whether it came from the disk cache
+        self.build_seconds = 0.0
+        self.from_cache = from_cache
+
+        # {character: {clip: [Texture, ...]}}, every texture is a region of the one sheet
+        # The mirrored frames face left and reuse the same pixels
+        sheet_texture = arcade.Texture(sheet)
+        self.animations = {}
+        self.mirrored_animations = {}
+        for character, clips in regions.items():
+            self.animations[character] = {}
+            self.mirrored_animations[character] = {}
+            for clip, frames in clips.items():
+                textures = [sheet_texture.crop(*frame) for frame in frames]
+                self.animations[character][clip] = textures
+                self.mirrored_animations[character][clip] = [texture.flip_left_right() for texture in textures]
+
+    def frames(self, character, clip, mirrored=False):
+        """Textures of one animation in play order"""
+        animations = self.mirrored_animations if mirrored else self.animations
+        return animations[character][clip]
+
+    def frame_count(self):
+        """Number of frames across every character and clip"""
+        return sum(len(frames) for clips in self.regions.values() for frames in clips.values())
+
+    def memory_bytes(self):
+        """Bytes of the packed RGBA sheet"""
+        return self.sheet.width * self.sheet.height * 4
+
+    def upload(self, atlas):
+        """Add every frame to a GPU texture atlas, call once a window exists"""
+
+        for animations in (self.animations, self.mirrored_animations):
+            for clips in animations.values():
+                for frames in clips.values():
+                    for texture in frames:
+                        atlas.add(texture)
+
+    def report(self):
+        """One line summary of the atlas build"""
+
+        source = "cache" if self.from_cache else "strips"
+        return (f"{self.frame_count()} frames from {source} in {self.build_seconds * 1000:.1f} ms, "
+                f"sheet {self.sheet.width}x{self.sheet.height}, {self.memory_bytes() / 1024:.0f} KB")
+
+
+def load_monster_atlas(sprites_dir=SPRITES_DIR, cache_dir=ATLAS_CACHE_DIR, rebuild=False):
+    """Load the packed sheet from the cache when it is up to date, otherwise pack and cache it"""
+
+    start = time.perf_counter()
+
+    strips = find_strips(sprites_dir)
+    key = _source_key(strips)
+
+    image_path = os.path.join(cache_dir, ATLAS_IMAGE_NAME)
+    index_path = os.path.join(cache_dir, ATLAS_INDEX_NAME)
+
+    if not rebuild and os.path.exists(index_path) and os.path.exists(image_path):
+        with open(index_path) as file:
+            index = json.load(file)
+        if index.get("key") == key:
+            sheet = Image.open(image_path).convert("RGBA")
+            regions = {character: {clip: [tuple(frame) for frame in frames] for clip, frames in clips.items()}
+                       for character, clips in index["regions"].items()}
+            atlas = MonsterAtlas(sheet, regions, from_cache=True)
+            atlas.build_seconds = time.perf_counter() - start
+            return atlas
+
+    sheet, regions = pack_strips(strips)
+
+    # A cache that cannot be written only costs the next startup a rebuild
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        sheet.save(image_path)
+        with open(index_path, "w") as file:
+            json.dump({"key": key, "regions": regions}, file)
+    except OSError:
+        pass
+
+    atlas = MonsterAtlas(sheet, regions, from_cache=False)
+    atlas.build_seconds = time.perf_counter() - start
+    return atlas
+
+
+def main():
+    """Build or load the atlas and print the report"""
+    parser = argparse.ArgumentParser(description="Pack the monster animation strips into one sheet")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the cached sheet")
+    args = parser.parse_args()
+
+    atlas = load_monster_atlas(rebuild=args.rebuild)
+    print(atlas.report())
+    for character, clips in atlas.regions.items():
+        print(f"{character}: " + ", ".join(f"{clip} {len(frames)}" for clip, frames in clips.items()))
+
+
+if __name__ == "__main__":
+    main()
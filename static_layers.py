@@ -0,0 +1,347 @@
+"""
+Static Layers
+
+Tile layers that never change after loading, like "Platforms", kept as packed
+arrays instead of one arcade.Sprite per tile. A StaticLayer holds the tile
+centers, sizes, angles and texture ids in NumPy arrays, the hit box bounds of
+every tile in one (n, 4) array and each distinct texture once, so a 100k tile
+layer is a few megabytes of arrays instead of 100k Python objects.
+
+Drawing uploads the arrays to the GPU once and renders them with the same
+shader arcade's SpriteList uses, so the tiles look exactly as they would as
+sprites. Tiles are sorted by chunk, and a frame only submits the chunk rows
+the camera can see. A StaticLayer has the same update_visible() and draw()
+as a ChunkedLayer, so CulledSceneRenderer draws it like one.
+
+Collision goes through the boxes: PlatformGrid(layer.boxes, cell_size) is the
+grid the swept physics engine and the enemies collide against. arcade's own
+platformer engine needs sprites, so GameWorld always uses swept collision
+on a level with static "Platforms".
+
+Layers whose options have "static": True are loaded this way, see
+level_cache.py. Compiled levels build them straight from the file's arrays,
+Tiled maps convert the sprites arcade made and let them go.
+
+Usage:
+    python static_layers.py bench --tiles 100000
+"""
+
+# type: ignore
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import arcade
+import numpy as np
+from arcade import gl
+
+from culling import CHUNK_SIZE
+from enemies import PlatformGrid
+
+# Constants
+# Layer option that asks for a StaticLayer instead of a SpriteList
+STATIC_OPTION = "static"
+
+# Texture filter SpriteList draws with, kept the same so tiles look the same
+TEXTURE_FILTER = arcade.SpriteList.DEFAULT_TEXTURE_FILTER
+
+
+def static_layer_names(layer_options):
+    """Names of the layers the options ask to load as StaticLayers"""
+    return [name for name, options in layer_options.items() if options.get(STATIC_OPTION)]
+
+
+def tile_boxes(center_x, center_y, bounds, scale_x, scale_y, angle):
+    """
+    Hit box bounds (left, right, bottom, top) of tiles, from the unscaled
+    bounds of their hit box polygons. Works the way a sprite's hit box does:
+    scaled first, then turned clockwise by angle degrees around the center.
+    """
+
+    corners_x = np.stack([bounds[:, 0], bounds[:, 1], bounds[:, 1], bounds[:, 0]], axis=1) * scale_x[:, None]
+    corners_y = np.stack([bounds[:, 2], bounds[:, 2], bounds[:, 3], bounds[:, 3]], axis=1) * scale_y[:, None]
+
+    radians = np.radians(angle)[:, None]
+    cos = np.cos(radians)
+    sin = np.sin(radians)
+    rotated_x = corners_x * cos + corners_y * sin
+    rotated_y = corners_y * cos - corners_x * sin
+
+    return np.stack([center_x + rotated_x.min(axis=1), center_x + rotated_x.max(axis=1),
+                     center_y + rotated_y.min(axis=1), center_y + rotated_y.max(axis=1)], axis=1)
+
+
+class StaticLayer:
+    """
+    One tile layer as arrays, drawn and collided against without sprites.
+    """
+
+    def __init__(self, textures, texture_ids, center_x, center_y, width, height, angle, boxes,
+                 visible=True, color=(1.0, 1.0, 1.0, 1.0), chunk_size=CHUNK_SIZE):
+
+        # Distinct textures, texture_ids index into this list
+        self.textures = list(textures)
+        self.visible = visible
+        # Normalized tint of the whole layer, like SpriteList.color
+        self.color = tuple(color)
+        self.chunk_size = chunk_size
+
+        center_x = np.asarray(center_x, dtype=np.float64)
+        center_y = np.asarray(center_y, dtype=np.float64)
+        count = len(center_x)
+
+        # Tiles are sorted by chunk row, then chunk column, so the visible part of a row is one contiguous range
+        columns = np.floor(center_x / chunk_size).astype(np.int64)
+        rows = np.floor(center_y / chunk_size).astype(np.int64)
+        self.first_column = int(columns.min()) if count else 0
+        self.last_column = int(columns.max()) if count else -1
+        self.first_row = int(rows.min()) if count else 0
+        self.last_row = int(rows.max()) if count else -1
+        self.row_span = self.last_column - self.first_column + 1
+        keys = (rows - self.first_row) * self.row_span + (columns - self.first_column)
+        order = np.argsort(keys, kind="stable")
+        self.chunk_keys = keys[order]
+
+        # Per tile arrays, all in chunk order
+        self.center_x = center_x[order].astype(np.float32)
+        self.center_y = center_y[order].astype(np.float32)
+        self.width = np.asarray(width, dtype=np.float32)[order]
+        self.height = np.asarray(height, dtype=np.float32)[order]
+        self.angle = np.asarray(angle, dtype=np.float32)[order]
+        self.texture_ids = np.asarray(texture_ids, dtype=np.uint32)[order]
+        # left, right, bottom, top of each tile's hit box, in full precision so collisions
+        # come out exactly as they would against the sprites
+        self.boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)[order]
+
+        # A tile reaches into the neighbouring chunk by up to half its size, the view is grown by that much
+        self.margin = float(max(self.width.max(), self.height.max()) / 2) if count else 0.0
+
+        # Chunk range the visible ranges were worked out for, and (first, count) per visible chunk row
+        self.visible_range = None
+        self.visible_chunks = []
+
+        # GPU side, made by initialize()
+        self.geometry = None
+        self.buffers = []
+        self.atlas = None
+
+    def __len__(self):
+        return len(self.center_x)
+
+    def nbytes(self):
+        """Memory the per tile arrays use"""
+        arrays = [self.center_x, self.center_y, self.width, self.height, self.angle, self.texture_ids, self.boxes, self.chunk_keys]
+        return sum(array.nbytes for array in arrays)
+
+    @classmethod
+    def from_sprite_list(cls, sprite_list, chunk_size=CHUNK_SIZE):
+        """Copy a layer of sprites into arrays, the sprites can be dropped afterwards"""
+
+        textures = {}
+        texture_ids = []
+        for sprite in sprite_list:
+            texture_ids.append(textures.setdefault(id(sprite.texture), (len(textures), sprite.texture))[0])
+
+        return cls(
+            [texture for _, texture in textures.values()],
+            texture_ids,
+            [sprite.center_x for sprite in sprite_list],
+            [sprite.center_y for sprite in sprite_list],
+            [sprite.width for sprite in sprite_list],
+            [sprite.height for sprite in sprite_list],
+            [sprite.angle for sprite in sprite_list],
+            [(sprite.left, sprite.right, sprite.bottom, sprite.top) for sprite in sprite_list],
+            visible=sprite_list.visible,
+            color=sprite_list.color.normalized,
+            chunk_size=chunk_size,
+        )
+
+    def initialize(self):
+        """Put the textures in the atlas and the arrays in GPU buffers, main thread only"""
+
+        if self.geometry is not None or not len(self):
+            return
+
+        ctx = arcade.get_window().ctx
+        atlas = ctx.default_atlas
+        slots = np.array([atlas.add(texture)[0] for texture in self.textures], dtype=np.float32)
+
+        count = len(self)
+        position_angle = np.zeros((count, 4), dtype=np.float32)
+        position_angle[:, 0] = self.center_x
+        position_angle[:, 1] = self.center_y
+        position_angle[:, 3] = self.angle
+        size = np.stack([self.width, self.height], axis=1)
+        texture = slots[self.texture_ids]
+        color = np.full((count, 4), 255, dtype=np.uint8)
+
+        # Same layout as SpriteList's buffers, so arcade's sprite shader can draw them
+        self.buffers = [ctx.buffer(data=array.tobytes()) for array in (position_angle, size, texture, color)]
+        position_buffer, size_buffer, texture_buffer, color_buffer = self.buffers
+        self.geometry = ctx.geometry([
+            gl.BufferDescription(position_buffer, "4f", ["in_pos"]),
+            gl.BufferDescription(size_buffer, "2f", ["in_size"]),
+            gl.BufferDescription(texture_buffer, "1f", ["in_texture"]),
+            gl.BufferDescription(color_buffer, "4f1", ["in_color"]),
+        ])
+        self.atlas = atlas
+
+    def update_visible(self, left, bottom, right, top):
+        """Work out the tile ranges overlapping a rectangle, only when it covers a different chunk range"""
+
+        size = self.chunk_size
+        margin = self.margin
+        chunk_range = (max(self.first_column, int(np.floor((left - margin) / size))),
+                       max(self.first_row, int(np.floor((bottom - margin) / size))),
+                       min(self.last_column, int(np.floor((right + margin) / size))),
+                       min(self.last_row, int(np.floor((top + margin) / size))))
+        if chunk_range == self.visible_range:
+            return False
+
+        min_column, min_row, max_column, max_row = chunk_range
+        self.visible_range = chunk_range
+        self.visible_chunks = []
+        if min_column > max_column:
+            return True
+        for row in range(min_row, max_row + 1):
+            row_start = (row - self.first_row) * self.row_span - self.first_column
+            first = int(np.searchsorted(self.chunk_keys, row_start + min_column, side="left"))
+            last = int(np.searchsorted(self.chunk_keys, row_start + max_column, side="right"))
+            if last > first:
+                self.visible_chunks.append((first, last - first))
+        return True
+
+    def draw(self):
+        """Draw the visible tiles and return how many there were"""
+
+        if not self.visible_chunks or not self.visible:
+            return 0
+
+        self.initialize()
+
+        ctx = self.geometry.ctx
+        program = ctx.sprite_list_program_cull
+        atlas = self.atlas
+        atlas_texture = atlas.texture
+        atlas_texture.filter = TEXTURE_FILTER
+        program["spritelist_color"] = self.color
+        program.set_uniform_safe("uv_offset_bias", 0.0 if ctx.NEAREST in atlas_texture.filter else 1.0)
+
+        ctx.enable(ctx.BLEND)
+        ctx.blend_func = ctx.BLEND_DEFAULT
+        atlas_texture.use(0)
+        atlas.use_uv_texture(1)
+
+        tiles = 0
+        for first, count in self.visible_chunks:
+            self.geometry.render(program, mode=ctx.POINTS, first=first, vertices=count)
+            tiles += count
+
+        ctx.disable(ctx.BLEND)
+        return tiles
+
+
+def build_bench_level(map_path, out_path, tiles, scaling, layer_options):
+    """Write a compiled level whose "Platforms" repeat a map's platforms side by side until there are tiles of them"""
+
+    # Imported here because level_compiler.py builds StaticLayers from this module
+    from level_compiler import write_level
+
+    tile_map = arcade.load_tilemap(map_path, scaling=scaling, layer_options=layer_options)
+    platforms = list(tile_map.sprite_lists["Platforms"])
+    map_width = tile_map.width * tile_map.tile_width * scaling
+
+    sprites = []
+    copy = 0
+    while len(sprites) < tiles:
+        for sprite in platforms[:tiles - len(sprites)]:
+            sprites.append(arcade.Sprite(sprite.texture, scale=sprite.scale,
+                                         center_x=sprite.center_x + copy * map_width, center_y=sprite.center_y))
+        copy += 1
+
+    write_level(out_path, tile_map, {"Platforms": sprites}, layer_options)
+    return len(sprites)
+
+
+def _build(kind, path, scaling, texture_cache):
+    """Load the bench level's platforms as sprites or arrays, with the platform grid built from them"""
+
+    # Imported here because level_compiler.py builds StaticLayers from this module
+    from level_compiler import load_compiled_level
+
+    if kind == "sprites":
+        level = load_compiled_level(path, texture_cache, lazy=True)
+        platforms = level.sprite_lists["Platforms"]
+        return platforms, PlatformGrid.from_sprite_list(platforms, level.tile_width * scaling)
+    level = load_compiled_level(path, texture_cache, lazy=True, static_layers=["Platforms"])
+    platforms = level.static_layers["Platforms"]
+    return platforms, PlatformGrid(platforms.boxes, level.tile_width * scaling)
+
+
+def _measure(kind, path, scaling):
+    """Build one layer in this process and return seconds taken, bytes it keeps alive and tiles built"""
+
+    # Decoding the tileset is the same for both kinds, done first so only the layer is measured
+    texture_cache = {}
+    _build("arrays", path, scaling, texture_cache)
+
+    start = time.perf_counter()
+    platforms, grid = _build(kind, path, scaling, texture_cache)
+    elapsed = time.perf_counter() - start
+    tiles = len(platforms)
+    del platforms, grid
+    gc.collect()
+
+    # Built again under tracemalloc, which would slow down the timed build
+    tracemalloc.start()
+    platforms, grid = _build(kind, path, scaling, texture_cache)
+    gc.collect()
+    kept, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, kept, tiles
+
+
+def main():
+    """Compare building a big platform layer as sprites and as a StaticLayer"""
+
+    # Imported here because world.py loads levels through this module
+    from world import LAYER_OPTIONS, MAP_PATH, TILE_SCALING
+
+    parser = argparse.ArgumentParser(description="Benchmark static array layers against sprite layers")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bench_command = commands.add_parser("bench", help="build a large compiled level and load its platforms both ways")
+    bench_command.add_argument("--tiles", type=int, default=100000, help="platform tiles in the level")
+    bench_command.add_argument("--map", default=MAP_PATH, help="map whose platforms are repeated")
+
+    measure_command = commands.add_parser("measure", help=argparse.SUPPRESS)
+    measure_command.add_argument("kind", choices=("sprites", "arrays"))
+    measure_command.add_argument("path")
+
+    args = parser.parse_args()
+
+    if args.command == "measure":
+        elapsed, kept, tiles = _measure(args.kind, args.path, TILE_SCALING)
+        print(f"{elapsed} {kept} {tiles}")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.plvl")
+        tiles = build_bench_level(args.map, path, args.tiles, TILE_SCALING, LAYER_OPTIONS)
+        print(f"{tiles} platform tiles")
+
+        # Each build runs in a fresh process so one does not reuse memory the other freed
+        for kind in ("sprites", "arrays"):
+            output = subprocess.run([sys.executable, __file__, "measure", kind, path],
+                                    check=True, capture_output=True, text=True).stdout.split()
+            elapsed, kept, tiles = float(output[-3]), int(output[-2]), int(output[-1])
+            print(f"{kind:>8}: {tiles} tiles, {elapsed * 1000:.1f} ms, {kept / 2 ** 20:.1f} MB kept")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Streaming
+
+Plays levels too big to keep loaded all at once. A level is split ahead of
+time into square chunks, each written as a small compiled level (see
+level_compiler.py) next to a manifest. While playing, the chunks around the
+player are loaded on a background thread and merged into one scene, and
+chunks far away are dropped, least recently needed first, once the loaded
+chunks go over a memory budget.
+
+Every layer of the scene is one SpriteList shared by all loaded chunks, so
+the "Platforms" spatial hash and the coin grid see tiles from neighbouring
+chunks exactly as if the whole map was loaded. The chunks the player touches
+and the ones next to them are always loaded before the player moves, waiting
+for them if the background thread is behind. Coins collected in a chunk are
+remembered when it is dropped and stay collected when it comes back.
+
+Enemies need the whole platform layer for their collision grid and are not
+streamed, a streamed level starts without them.
+
+Usage:
+    python streaming.py split :resources:tiled_maps/map2_level_1.json map2_level_1.stream
+    python world.py --map map2_level_1.stream
+"""
+
+# type: ignore
+import argparse
+import json
+import math
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import arcade
+
+from collectibles import build_collectibles
+from enemies import PlatformGrid
+from level_compiler import CompiledLevel, load_compiled_level, write_level
+
+# Constants
+STREAMED_EXTENSION = ".stream"
+MANIFEST_NAME = "manifest.json"
+
+# Width and height of a chunk in tiles
+CHUNK_TILES = 16
+
+# Chunks this many chunks away from the player's chunk are loaded ahead of time
+LOAD_RADIUS = 2
+
+# Memory the loaded chunks may use before far ones are dropped
+MEMORY_BUDGET_BYTES = 64 * 1024 * 1024
+
+
+def _chunk_file(column, row):
+    return f"chunk_{column}_{row}.plvl"
+
+
+def split_level(map_path, out_dir, scaling, layer_options, chunk_tiles=CHUNK_TILES):
+    """Cut a Tiled map into chunk files plus a manifest in out_dir"""
+
+    tile_map = arcade.load_tilemap(map_path, scaling=scaling, layer_options=layer_options)
+    chunk_size = chunk_tiles * tile_map.tile_width * scaling
+
+    # Every sprite goes in the chunk its center is in, so no sprite is in two chunks
+    chunks = {}
+    for name, sprite_list in tile_map.sprite_lists.items():
+        for sprite in sprite_list:
+            key = (math.floor(sprite.center_x / chunk_size), math.floor(sprite.center_y / chunk_size))
+            layers = chunks.setdefault(key, {layer: [] for layer in tile_map.sprite_lists})
+            layers[name].append(sprite)
+
+    os.makedirs(out_dir, exist_ok=True)
+    for (column, row), layers in chunks.items():
+        write_level(os.path.join(out_dir, _chunk_file(column, row)), tile_map, layers, layer_options)
+
+    manifest = {
+        "scaling": scaling,
+        "width": tile_map.width,
+        "height": tile_map.height,
+        "tile_width": tile_map.tile_width,
+        "tile_height": tile_map.tile_height,
+        "chunk_size": chunk_size,
+        # Layer names in draw order with whether each uses a spatial hash
+        "layers": [[name, bool(layer_options.get(name, {}).get("use_spatial_hash"))] for name in tile_map.sprite_lists],
+        "chunks": sorted(chunks),
+        # How many of each pickup the whole map holds, a streamed level only sees the loaded chunks' ones
+        "pickups": {name: len(tile_map.sprite_lists[name]) for name, options in layer_options.items()
+                    if options.get("collectible") and name in tile_map.sprite_lists},
+    }
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w") as file:
+        json.dump(manifest, file)
+    return manifest
+
+
+class LoadedChunk:
+    """
+    The sprites one chunk added to the scene.
+    """
+
+    def __init__(self, key, sprite_lists):
+        self.key = key
+        self.sprite_lists = sprite_lists
+        self.sprite_count = sum(len(sprite_list) for sprite_list in sprite_lists.values())
+
+
+class StreamedLevel:
+    """
+    A level whose chunks come and go around the player. Used by LevelCache in
+    place of a CachedLevel for .stream directories.
+    """
+
+    streamed = True
+
+    def __init__(self, path, layer_options, sprite_bytes, memory_budget=MEMORY_BUDGET_BYTES, load_radius=LOAD_RADIUS):
+
+        self.path = path
+        self.layer_options = layer_options
+        self.memory_budget = memory_budget
+        self.load_radius = load_radius
+
+        # Estimated bytes per loaded sprite, the level cache hands in its own estimate
+        self.sprite_bytes = sprite_bytes
+
+        with open(os.path.join(path, MANIFEST_NAME)) as file:
+            manifest = json.load(file)
+
+        self.chunk_size = manifest["chunk_size"]
+        self.available = {tuple(key) for key in manifest["chunks"]}
+
+        # One shared sprite list per layer, chunks add and remove their sprites
+        self.scene = arcade.Scene()
+        for name, use_spatial_hash in manifest["layers"]:
+            self.scene.add_sprite_list(name, use_spatial_hash=use_spatial_hash)
+
+        # Looks like a tile map to the rest of the game
+        sprite_lists = {name: self.scene[name] for name, _ in manifest["layers"]}
+        self.tile_map = CompiledLevel(manifest["scaling"], manifest["width"], manifest["height"],
+                                      manifest["tile_width"], manifest["tile_height"], sprite_lists)
+
+        self.collectibles = build_collectibles(self.scene, layer_options)
+        self.platform_grid = PlatformGrid([], manifest["tile_width"] * manifest["scaling"])
+
+        # How many of each pickup the whole level holds, unknown for manifests split before it was written
+        self.pickup_counts = manifest.get("pickups", {})
+
+        # Chunks always arrive as sprites, static array layers are for fully loaded levels
+        self.static_layers = {}
+        self.layer_names = list(sprite_lists)
+
+        # Textures shared by every chunk cut from the same tilesets
+        self.texture_cache = {}
+
+        # Loaded chunks, least recently needed first
+        self.loaded = OrderedDict()
+
+        # Chunks being loaded in the background, key -> Future
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chunk-loader")
+
+        # (chunk, layer, index in the chunk) of every pickup collected so far
+        self.collected = set()
+
+        # Counters for tuning the radius and budget
+        self.chunks_loaded = 0
+        self.chunks_evicted = 0
+        self.blocking_loads = 0
+
+    def _load(self, key):
+        """
+        Runs on the loader thread, builds the chunk's sprites without touching
+        the GPU. Only ever called there, the texture cache is not locked.
+        """
+        column, row = key
+        return load_compiled_level(os.path.join(self.path, _chunk_file(column, row)), self.texture_cache, lazy=True)
+
+    def _chunk_of(self, x, y):
+        return math.floor(x / self.chunk_size), math.floor(y / self.chunk_size)
+
+    def _around(self, key, radius):
+        column, row = key
+        return {(column + dx, row + dy)
+                for dx in range(-radius, radius + 1)
+                for dy in range(-radius, radius + 1)
+                if (column + dx, row + dy) in self.available}
+
+    def _add(self, key, compiled):
+        """Merge a loaded chunk into the scene, leaving out pickups collected before"""
+
+        for name, sprite_list in compiled.sprite_lists.items():
+            sprites = list(sprite_list)
+            # The chunk's own list is only a carrier, its sprites move to the shared one
+            sprite_list.clear()
+            if name in self.collectibles:
+                index = self.collectibles[name]
+                kept = []
+                for position, sprite in enumerate(sprites):
+                    if (key, name, position) not in self.collected:
+                        kept.append(sprite)
+                        index.add(sprite)
+                self.scene[name].extend(kept)
+                # Positions are kept so a collected pickup can be found again on eviction
+                compiled.sprite_lists[name] = sprites
+            else:
+                self.scene[name].extend(sprites)
+                compiled.sprite_lists[name] = sprites
+
+        self.loaded[key] = LoadedChunk(key, compiled.sprite_lists)
+        self.chunks_loaded += 1
+
+    def _evict(self, key):
+        """Take a chunk's sprites out of the scene, remembering which pickups are gone"""
+
+        chunk = self.loaded.pop(key)
+        for name, sprites in chunk.sprite_lists.items():
+            index = self.collectibles.get(name)
+            for position, sprite in enumerate(sprites):
+                if index is not None:
+                    # A pickup no longer in any sprite list was collected
+                    if not sprite.sprite_lists:
+                        self.collected.add((key, name, position))
+                    index.remove(sprite)
+                if sprite.sprite_lists:
+                    sprite.remove_from_sprite_lists()
+        self.chunks_evicted += 1
+
+    def memory_bytes(self):
+        """Estimated memory of the loaded chunks"""
+        return self.sprite_count() * self.sprite_bytes
+
+    def stream(self, position):
+        """
+        Call every step with the player's position. Makes sure the chunks the
+        player can touch are loaded, queues the ones within the load radius
+        and drops far chunks while over the memory budget.
+        """
+
+        center = self._chunk_of(*position)
+        required = self._around(center, 1)
+        wanted = self._around(center, self.load_radius)
+
+        # Finished background loads are merged on the main thread
+        for key, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[key]
+                self._add(key, future.result())
+
+        # The player must never reach a chunk that is not there yet
+        # A chunk not queued yet is still loaded on the loader thread and waited for,
+        # so two loads never share the texture cache at once
+        for key in required:
+            if key in self.loaded:
+                continue
+            future = self.pending.pop(key, None)
+            if future is None:
+                future = self.executor.submit(self._load, key)
+            self._add(key, future.result())
+            self.blocking_loads += 1
+
+        for key in wanted:
+            if key in self.loaded:
+                self.loaded.move_to_end(key)
+            elif key not in self.pending:
+                self.pending[key] = self.executor.submit(self._load, key)
+
+        # Least recently needed chunks outside the load radius go first
+        if self.memory_bytes() > self.memory_budget:
+            for key in list(self.loaded):
+                if key in wanted:
+                    continue
+                self._evict(key)
+                if self.memory_bytes() <= self.memory_budget:
+                    break
+
+    def reset(self):
+        """Drop every chunk and forget collected pickups, for a restart"""
+
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        for key in list(self.loaded):
+            self._evict(key)
+        self.collected.clear()
+
+    def close(self):
+        """Stop the loader thread, for when the level is dropped from the cache"""
+        self.reset()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def sprite_count(self):
+        return sum(chunk.sprite_count for chunk in self.loaded.values())
+
+    def textures(self):
+        return list(self.texture_cache.values())
+
+
+def main():
+    """Split a Tiled map into a streamed level"""
+
+    # Imported here because world.py loads levels through this module
+    from world import LAYER_OPTIONS, TILE_SCALING
+
+    parser = argparse.ArgumentParser(description="Split Tiled maps into streamed chunks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    split_command = commands.add_parser("split", help="write a .stream directory for a Tiled map")
+    split_command.add_argument("map", help="Tiled map to split")
+    split_command.add_argument("out", help=f"directory to write, ending in {STREAMED_EXTENSION}")
+    split_command.add_argument("--chunk-tiles", type=int, default=CHUNK_TILES, help="chunk width and height in tiles")
+
+    args = parser.parse_args()
+
+    manifest = split_level(args.map, args.out, TILE_SCALING, LAYER_OPTIONS, args.chunk_tiles)
+    print(f"wrote {len(manifest['chunks'])} chunks of {args.chunk_tiles}x{args.chunk_tiles} tiles to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Swept Physics
+
+A platformer physics engine with continuous collision, a drop-in for
+arcade.PhysicsEnginePlatformer in GameWorld. The arcade engine moves the
+player a whole tick at once and then pushes it out of whatever it overlaps,
+so at high speeds the player can pass clean through a thin platform or a
+coin without ever overlapping it. This engine sweeps the player's box along
+each axis instead: the move stops at the first platform edge crossed on the
+way, however far the move is, and the boxes swept through are kept so
+pickups passed over during the tick are collected too.
+
+Platforms come from the level's PlatformGrid, so a sweep only looks at the
+grid cells between where the player starts and ends. Platforms are treated
+as the bounding box of their hit box, which is what tile platforms are.
+
+The order of a tick matches the arcade engine: gravity is taken off the
+vertical speed, then the player moves vertically, then horizontally.
+"""
+
+# type: ignore
+import math
+
+# Constants
+# How far below the feet can_jump() looks for ground, same as the arcade engine
+CAN_JUMP_DISTANCE = 5
+
+# Gap kept between the player and a platform it stops against, so it is touching but not inside it
+CONTACT_EPSILON = 1e-6
+
+
+class SweptPhysicsEngine:
+    """
+    Moves one sprite with gravity, stopping at the first platform it would pass.
+    """
+
+    def __init__(self, player_sprite, platform_grid, gravity_constant):
+
+        self.player_sprite = player_sprite
+        self.grid = platform_grid
+        self.gravity_constant = gravity_constant
+
+        # Nested lists of plain floats are quicker to index one box at a time than the NumPy array
+        self.boxes = platform_grid.boxes.tolist()
+
+        # Kept for code that reads it off the arcade engine, this engine has no multi jump
+        self.jumps_since_ground = 0
+
+        # The player's hit box relative to its center, taken once since the player does not rotate or scale
+        self.box_left = player_sprite.left - player_sprite.center_x
+        self.box_right = player_sprite.right - player_sprite.center_x
+        self.box_bottom = player_sprite.bottom - player_sprite.center_y
+        self.box_top = player_sprite.top - player_sprite.center_y
+
+        # left, right, bottom, top of the areas the player's box swept through in the last update
+        self.swept_boxes = []
+
+    def _boxes(self, left, right, bottom, top):
+        """Platform boxes in the grid cells touching an area"""
+
+        grid = self.grid
+        size = grid.cell_size
+        boxes = self.boxes
+        for row in range(max(0, math.floor(bottom / size)), min(grid.rows, math.floor(top / size) + 1)):
+            for column in range(max(0, math.floor(left / size)), min(grid.columns, math.floor(right / size) + 1)):
+                box = boxes[row][column]
+                # Empty cells are NaN and fail every comparison
+                if box[0] == box[0]:
+                    yield box
+
+    def _sweep_y(self, left, right, bottom, top, change_y):
+        """How far the box can move vertically before touching a platform, and whether a platform stopped it"""
+
+        hit = False
+        if change_y < 0:
+            limit = change_y
+            for box in self._boxes(left, right, bottom + change_y, bottom):
+                # Platforms beside the box or already above its feet are not in the way
+                if box[0] < right and box[1] > left and bottom + change_y <= box[3] <= bottom + CONTACT_EPSILON:
+                    limit = max(limit, box[3] - bottom)
+                    hit = True
+            return limit, hit
+        limit = change_y
+        for box in self._boxes(left, right, top, top + change_y):
+            if box[0] < right and box[1] > left and top - CONTACT_EPSILON <= box[2] <= top + change_y:
+                limit = min(limit, box[2] - top)
+                hit = True
+        return limit, hit
+
+    def _sweep_x(self, left, right, bottom, top, change_x):
+        """How far the box can move sideways before touching a platform"""
+
+        if change_x > 0:
+            limit = change_x
+            for box in self._boxes(right, right + change_x, bottom, top):
+                if box[2] < top and box[3] > bottom and box[0] >= right - CONTACT_EPSILON:
+                    limit = min(limit, box[0] - right)
+            return limit
+        limit = change_x
+        for box in self._boxes(left + change_x, left, bottom, top):
+            if box[2] < top and box[3] > bottom and box[1] <= left + CONTACT_EPSILON:
+                limit = max(limit, box[1] - left)
+        return limit
+
+    def update(self):
+        """Move the player one tick"""
+
+        player = self.player_sprite
+        player.change_y -= self.gravity_constant
+
+        x = player.center_x
+        y = player.center_y
+        left = x + self.box_left
+        right = x + self.box_right
+
+        # A player placed inside platforms, like at the start of a level, is first lifted out on top of them
+        bottom = y + self.box_bottom
+        while True:
+            inside = [box[3] for box in self._boxes(left, right, bottom, y + self.box_top)
+                      if box[0] < right and box[1] > left and box[2] < y + self.box_top and box[3] > bottom + CONTACT_EPSILON]
+            if not inside:
+                break
+            y += max(inside) - bottom
+            bottom = y + self.box_bottom
+        top = y + self.box_top
+
+        # Vertical first, like the arcade engine
+        move_y, stopped = self._sweep_y(left, right, bottom, top, player.change_y)
+        if stopped:
+            player.change_y = 0
+        self.swept_boxes = [(left, right, min(bottom, bottom + move_y), max(top, top + move_y))]
+        bottom += move_y
+        top += move_y
+        y += move_y
+
+        if player.change_x:
+            move_x = self._sweep_x(left, right, bottom, top, player.change_x)
+            self.swept_boxes.append((min(left, left + move_x), max(right, right + move_x), bottom, top))
+            x += move_x
+
+        player.position = (x, y)
+
+    def can_jump(self, y_distance=CAN_JUMP_DISTANCE):
+        """True while the player stands on a platform, or is less than y_distance above one"""
+
+        player = self.player_sprite
+        left = player.center_x + self.box_left
+        right = player.center_x + self.box_right
+        bottom = player.center_y + self.box_bottom
+        top = player.center_y + self.box_top
+        _, stopped = self._sweep_y(left, right, bottom, top, -y_distance)
+        if stopped:
+            self.jumps_since_ground = 0
+        return stopped
@@ -0,0 +1,40 @@
+"""
+Shared setup for the tests. The game modules live at the top of the
+repository and arcade has to be told it is headless before it is imported.
+"""
+
+# type: ignore
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("ARCADE_HEADLESS", "1")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Sprite paths like ./Sprites/... are relative to the repository
+os.chdir(ROOT)
+
+
+def play_right(world, ticks=600):
+    """Set a world up, run right for ticks steps jumping now and then, and return its hash, score and position"""
+    # Imported here because arcade has to see ARCADE_HEADLESS first
+    import arcade
+
+    world.setup()
+    world.on_key_press(arcade.key.RIGHT)
+    for tick in range(ticks):
+        if tick % 40 == 0:
+            world.on_key_press(arcade.key.UP)
+        elif tick % 40 == 20:
+            world.on_key_release(arcade.key.UP)
+        world.step()
+    return world.state_hash(), world.score, world.player_sprite.position
+
+
+@pytest.fixture
+def play():
+    return play_right
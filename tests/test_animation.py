@@ -0,0 +1,30 @@
+# type: ignore
+import arcade
+import numpy as np
+
+from animation import AnimationSystem
+from enemies import EnemySystem, PlatformGrid
+from sprite_atlas import load_monster_atlas
+from world import GRAVITY
+
+
+def test_only_visible_enemies_get_textures():
+    enemies = EnemySystem(PlatformGrid([], 64), GRAVITY)
+    enemies.spawn([100, 5000], [100, 100])
+    animations = AnimationSystem(load_monster_atlas())
+    for index in range(len(enemies)):
+        sprite = arcade.Sprite()
+        animations.add(sprite, "Dude_Monster")
+        enemies.attach_sprite(index, sprite)
+    enemies.sync_sprites(0, 0, 1280, 720, animations=animations)
+    idle = [sprite.texture for sprite in enemies.sprites]
+
+    # Walking changes the frame of both, only the one on screen is given it
+    assert animations.update(0.5, [True, True], [5.0, 5.0], [0.0, 0.0], visible=enemies.was_visible) == 1
+    assert enemies.sprites[0].texture is not idle[0]
+    assert enemies.sprites[1].texture is idle[1]
+
+    # Coming into view shows the frame the arrays are on
+    enemies.sync_sprites(4000, 0, 1280, 720, animations=animations)
+    assert enemies.sprites[1].texture is animations.textures[animations.frame_index[1]]
+    assert np.array_equal(animations.texture_index, animations.frame_index)
@@ -0,0 +1,71 @@
+# type: ignore
+from audio import NullAudioBackend, SoundManager
+
+COIN = ":resources:sounds/coin1.wav"
+JUMP = ":resources:sounds/jump1.wav"
+
+
+class Clock:
+    """Time that only moves when a test says so"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def manager(max_voices):
+    clock = Clock()
+    sounds = SoundManager(NullAudioBackend(clock), max_voices=max_voices)
+    sounds.register("coin", COIN, priority=0, max_concurrent=2)
+    sounds.register("jump", JUMP, priority=1, max_concurrent=1)
+    sounds.register("music", JUMP, priority=2, max_concurrent=1)
+    return sounds, clock
+
+
+def test_one_tick_of_coins_plays_once_and_voices_end_with_the_sound():
+    sounds, clock = manager(8)
+    for _ in range(5):
+        sounds.play("coin")
+    sounds.update()
+    assert sounds.metrics()["voices"] == 1
+    assert sounds.metrics()["deduplicated"] == 4
+
+    clock.now = 1.0
+    sounds.update()
+    assert sounds.metrics()["voices"] == 0
+
+
+def test_a_sound_at_its_limit_replaces_its_oldest_copy():
+    sounds, _ = manager(8)
+    for _ in range(3):
+        sounds.play("coin")
+        sounds.update()
+    assert [voice.order for voice in sounds.voices] == [1, 2]
+    assert sounds.metrics()["played"] == 3
+
+
+def test_a_full_pool_steals_from_lower_priority_and_drops_otherwise():
+    sounds, _ = manager(2)
+    sounds.play("coin")
+    sounds.update()
+    sounds.play("coin")
+    sounds.update()
+
+    # A jump outranks the coins and takes the oldest coin's voice
+    sounds.play("jump")
+    sounds.update()
+    assert sorted(voice.name for voice in sounds.voices) == ["coin", "jump"]
+    assert sounds.metrics()["stolen"] == 1
+
+    # Music takes the coin's voice, then a coin has nothing at or below its priority to take
+    sounds.play("music")
+    sounds.update()
+    sounds.play("coin")
+    sounds.update()
+    metrics = sounds.metrics()
+    assert sorted(voice.name for voice in sounds.voices) == ["jump", "music"]
+    assert metrics["stolen"] == 2
+    assert metrics["dropped"] == 1
+    assert metrics["peak_voices"] == 2
@@ -0,0 +1,29 @@
+# type: ignore
+import subprocess
+import sys
+
+from level_compiler import compile_level
+from world import LAYER_OPTIONS, MAP_PATH, TILE_SCALING, GameWorld
+
+
+def test_compiled_level_plays_the_same_as_the_tiled_map(tmp_path, play):
+    compiled = str(tmp_path / "level.plvl")
+    compile_level(MAP_PATH, compiled, TILE_SCALING, LAYER_OPTIONS)
+
+    _, tiled_score, tiled_position = play(GameWorld(map_path=MAP_PATH))
+    _, compiled_score, compiled_position = play(GameWorld(map_path=compiled))
+
+    assert compiled_score == tiled_score
+    assert compiled_position == tiled_position
+
+
+def test_compiled_level_loads_the_same_every_time(tmp_path, play):
+    compiled = str(tmp_path / "level.plvl")
+    compile_level(MAP_PATH, compiled, TILE_SCALING, LAYER_OPTIONS)
+    assert play(GameWorld(map_path=compiled)) == play(GameWorld(map_path=compiled))
+
+
+def test_imports_without_the_resource_module():
+    # resource does not exist on Windows, the game imports this module through level_cache
+    code = "import sys; sys.modules['resource'] = None; import world"
+    subprocess.run([sys.executable, "-c", code], check=True)
@@ -0,0 +1,50 @@
+# type: ignore
+import arcade
+import pytest
+
+from navigation import JUMP, build_navigation, player_box
+from world import GRAVITY, PLAYER_JUMP_SPEED, PLAYER_MOVEMENT_SPEED, PLAYER_START_X, PLAYER_START_Y, GameWorld
+
+
+@pytest.fixture(scope="module")
+def graph():
+    world = GameWorld()
+    world.setup()
+    return build_navigation(world.level.platform_grid, GRAVITY, PLAYER_JUMP_SPEED, PLAYER_MOVEMENT_SPEED,
+                            player_box(world.player_sprite))
+
+
+def test_jumps_land_where_the_game_lands(graph):
+    jumps = [edge for edge in range(graph.edge_count) if graph.edge_kind[edge] == JUMP]
+    assert jumps
+
+    # The first jumps are over plain square tiles, sloped ones are only approximated by their bounding box
+    for edge in jumps[:20]:
+        points = graph.edge_points(edge)
+        (start_x, start_y), (end_x, end_y) = points[0], points[-1]
+
+        # Jump from the edge's take off while running its way, holding UP the whole arc
+        world = GameWorld()
+        world.setup()
+        world.player_sprite.center_x = float(start_x)
+        world.player_sprite.bottom = float(start_y)
+        world.on_key_press(arcade.key.RIGHT if end_x > start_x else arcade.key.LEFT)
+        world.on_key_press(arcade.key.UP)
+        for _ in range(int(graph.edge_ticks[edge])):
+            world.step()
+
+        assert world.player_sprite.center_x == pytest.approx(end_x, abs=0.01)
+        assert world.player_sprite.bottom == pytest.approx(end_y, abs=0.01)
+        assert world.physics_engine.can_jump()
+
+
+def test_find_path_chains_edges_to_the_goal(graph):
+    start = graph.nearest_node(PLAYER_START_X, PLAYER_START_Y)
+    goal = max(graph.reachable_from(start), key=lambda node: graph.node_x[node])
+    path = graph.find_path(start, goal)
+
+    node = start
+    for edge in path:
+        assert edge in graph.edges_from(node)
+        node = graph.edge_target[edge]
+    assert node == goal
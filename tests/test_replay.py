@@ -0,0 +1,36 @@
+# type: ignore
+import pyglet
+
+from replay import EVENTS, InputRecorder, Recording
+
+
+def test_keys_without_a_symbol_round_trip(tmp_path):
+    # pyglet numbers keys without a symbol by scancode << 32, past a u32
+    key = pyglet.window.key.user_key(0x1F4)
+    recorder = InputRecorder()
+    recorder.press(key)
+    recorder.advance()
+    recorder.release(key)
+
+    path = tmp_path / "run.bin"
+    recorder.save(path)
+
+    assert Recording.load(path).events == [(0, 1, key), (1, 0, key)]
+
+
+def test_version_one_recordings_still_load(tmp_path):
+    recorder = InputRecorder()
+    recorder.press(65362)
+    recorder.advance()
+    path = tmp_path / "old.bin"
+    recorder.save(path)
+
+    # Rewrite the file the way version 1 laid it out
+    data = bytearray(path.read_bytes())
+    data[4:6] = (1).to_bytes(2, "little")
+    header_end = len(data) - EVENTS[2].size
+    path.write_bytes(bytes(data[:header_end]) + EVENTS[1].pack(0, 1, 65362))
+
+    recording = Recording.load(path)
+    assert recording.frame_count == 1
+    assert recording.events == [(0, 1, 65362)]
@@ -0,0 +1,60 @@
+# type: ignore
+import arcade
+
+from world import GameWorld
+
+MAP = ":resources:tiled_maps/map2_level_2.json"
+
+
+def play(world, until):
+    """Run right and jump until world.tick reaches until"""
+    while world.tick < until:
+        if world.tick % 45 == 0:
+            world.on_key_press(arcade.key.RIGHT)
+            world.on_key_press(arcade.key.UP)
+        if world.tick % 45 == 22:
+            world.on_key_release(arcade.key.UP)
+        world.step()
+        world.events.clear()
+
+
+def test_restore_plays_the_same_again():
+    world = GameWorld(map_path=MAP)
+    world.setup()
+    world.enemies.spawn([300, 600], [400, 400])
+
+    play(world, 50)
+    snapshot = world.snapshot()
+    before = world.state_hash()
+    coins = len(world.scene["Coins"])
+    play(world, 400)
+    after = world.state_hash()
+    assert len(world.scene["Coins"]) < coins
+
+    world.restore(snapshot)
+    assert world.state_hash() == before
+    # Coins collected after the snapshot are back
+    assert len(world.scene["Coins"]) == coins
+
+    play(world, 400)
+    assert world.state_hash() == after
+
+
+def test_restore_puts_coins_back_in_map_order():
+    world = GameWorld(map_path=MAP)
+    world.setup()
+    initial = world.level.initial_pickups["Coins"]
+
+    snapshot = world.snapshot()
+    play(world, 400)
+    middle = world.snapshot()
+    assert len(world.scene["Coins"]) < len(initial)
+
+    world.restore(snapshot)
+    assert list(world.scene["Coins"]) == initial
+    assert not world.collectibles["Coins"].removed.any()
+
+    world.restore(middle)
+    left = list(world.scene["Coins"])
+    assert left == [sprite for sprite in initial if sprite in left]
+    assert world.collectibles["Coins"].removed.sum() == len(initial) - len(left)
@@ -0,0 +1,45 @@
+# type: ignore
+import copy
+
+import arcade
+import pytest
+
+from level_cache import LevelCache, build_level
+from level_compiler import compile_level
+from swept_physics import SweptPhysicsEngine
+from world import LAYER_OPTIONS, MAP_PATH, TILE_SCALING, GameWorld
+
+# Platforms and a layer from the middle of the map kept as arrays
+STATIC_OPTIONS = copy.deepcopy(LAYER_OPTIONS)
+STATIC_OPTIONS["Platforms"]["static"] = True
+STATIC_OPTIONS["Don't Touch"] = {"static": True}
+
+
+@pytest.mark.parametrize("compiled", [False, True])
+def test_static_layers_keep_their_place_in_the_map(tmp_path, compiled):
+    map_path = MAP_PATH
+    if compiled:
+        map_path = str(tmp_path / "level.plvl")
+        compile_level(MAP_PATH, map_path, TILE_SCALING, LAYER_OPTIONS)
+
+    order = list(arcade.load_tilemap(MAP_PATH, scaling=TILE_SCALING, layer_options=LAYER_OPTIONS).sprite_lists)
+    level = build_level(map_path, TILE_SCALING, STATIC_OPTIONS)
+
+    assert set(level.static_layers) == {"Platforms", "Don't Touch"}
+    assert level.layer_names == order
+
+
+def test_static_platforms_are_swept():
+    level_cache = LevelCache()
+    level_cache.add_level(MAP_PATH, build_level(MAP_PATH, TILE_SCALING, STATIC_OPTIONS))
+    world = GameWorld(level_cache=level_cache)
+    world.setup()
+    assert isinstance(world.physics_engine, SweptPhysicsEngine)
+
+    sprites = GameWorld()
+    sprites.setup()
+    for _ in range(120):
+        world.step()
+        sprites.step()
+    assert world.physics_engine.can_jump()
+    assert world.player_sprite.position == pytest.approx(sprites.player_sprite.position, abs=0.01)
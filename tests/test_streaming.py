@@ -0,0 +1,50 @@
+# type: ignore
+import pytest
+
+from streaming import split_level
+from world import LAYER_OPTIONS, MAP_PATH, TILE_SCALING, GameWorld
+
+
+@pytest.fixture(scope="module")
+def streamed_map(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("levels") / "level.stream")
+    split_level(MAP_PATH, path, TILE_SCALING, LAYER_OPTIONS)
+    return path
+
+
+@pytest.fixture
+def streamed_world(streamed_map):
+    world = GameWorld(map_path=streamed_map)
+    yield world
+    # Stops the chunk loader thread
+    world.level.close()
+
+
+def settle(world, ticks=600):
+    world.setup()
+    for _ in range(ticks):
+        world.step()
+    return world.player_sprite.position
+
+
+def test_streamed_level_keeps_the_player_on_the_ground(streamed_world):
+    x, y = settle(streamed_world)
+
+    # Lands on the same ground it stands on when the whole map is loaded
+    assert (x, y) == settle(GameWorld(map_path=MAP_PATH))
+    assert y > 0
+    assert streamed_world.physics_engine.can_jump()
+
+
+def test_streamed_level_plays_like_the_loaded_map(streamed_world, play):
+    # Score and position, the hash counts the coins in the scene and a streamed one holds only nearby chunks
+    assert play(streamed_world)[1:] == play(GameWorld(map_path=MAP_PATH))[1:]
+
+
+def test_streamed_level_knows_every_coin(streamed_world):
+    streamed_world.setup()
+    loaded = GameWorld(map_path=MAP_PATH)
+    loaded.setup()
+
+    # Taken from the manifest, not from the coins in the chunks loaded so far
+    assert streamed_world.level.pickup_counts == loaded.level.pickup_counts
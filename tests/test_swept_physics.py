@@ -0,0 +1,44 @@
+# type: ignore
+import arcade
+import numpy as np
+import pytest
+
+from enemies import PlatformGrid
+from swept_physics import SweptPhysicsEngine
+from world import COLLISION_DISCRETE, COLLISION_SWEPT, GRAVITY, GameWorld
+
+
+def landing(collision, right_ticks):
+    """Where the player stands after running right for right_ticks and settling"""
+    world = GameWorld(collision=collision)
+    world.setup()
+    world.on_key_press(arcade.key.RIGHT)
+    for _ in range(right_ticks):
+        world.step()
+    world.on_key_release(arcade.key.RIGHT)
+    for _ in range(120):
+        world.step()
+    assert world.physics_engine.can_jump()
+    return world.player_sprite.position
+
+
+@pytest.mark.parametrize("right_ticks", [0, 30, 90])
+def test_swept_lands_where_discrete_does(right_ticks):
+    discrete = landing(COLLISION_DISCRETE, right_ticks)
+    swept = landing(COLLISION_SWEPT, right_ticks)
+    assert swept == pytest.approx(discrete, abs=0.01)
+
+
+def test_platform_wider_than_a_cell_is_in_every_cell():
+    grid = PlatformGrid([(0, 640, 0, 64)], 64)
+
+    hit, _ = grid.boxes_at(np.array([32.0, 320.0, 600.0]), np.full(3, 32.0))
+    assert hit.all()
+
+    # Falling onto the far end of the platform, not its middle
+    player = arcade.SpriteSolidColor(32, 32, center_x=600, center_y=300)
+    engine = SweptPhysicsEngine(player, grid, GRAVITY)
+    for _ in range(120):
+        engine.update()
+    assert player.bottom == pytest.approx(64)
+    assert engine.can_jump()
@@ -0,0 +1,46 @@
+# type: ignore
+import arcade
+
+from replay import InputRecorder, Recording, replay
+from validate_levels import run_batch, simulate
+from world import MAP_PATH
+
+
+def record(path, events, frames):
+    """Save a recording of events {frame: [(pressed, key)]} with replay's final hash"""
+    recorder = InputRecorder()
+    for frame in range(frames):
+        for pressed, key in events.get(frame, ()):
+            recorder.events.append((frame, pressed, key))
+        recorder.advance()
+    recorder.save(path)
+    recording = Recording.load(path)
+    recorder.save(path, bytes.fromhex(replay(recording)["final_hash"]))
+
+
+def test_script_reproduces_the_recording(tmp_path):
+    # UP pressed again in the air must not jump on landing, ESC restarts
+    events = {
+        0: [(1, arcade.key.RIGHT)],
+        10: [(1, arcade.key.UP)],
+        12: [(0, arcade.key.UP)],
+        25: [(1, arcade.key.UP)],
+        90: [(0, arcade.key.UP)],
+        150: [(1, arcade.key.ESCAPE)],
+        151: [(0, arcade.key.ESCAPE)],
+        160: [(1, arcade.key.UP)],
+        200: [(0, arcade.key.RIGHT), (1, arcade.key.LEFT)],
+    }
+    path = tmp_path / "run.bin"
+    record(path, events, 240)
+
+    result = simulate(Recording.load(path).map_path, f"script:{path}")
+
+    assert result["ticks"] == 240
+    assert result["state_hash"] == Recording.load(path).final_hash.hex()
+
+
+def test_only_the_random_policy_runs_once_per_seed():
+    results = run_batch([MAP_PATH], ["right", "random"], seeds=3, max_ticks=60, workers=1)
+    assert [(result["policy"], result["seed"]) for result in results] == [
+        ("right", 0), ("random", 0), ("random", 1), ("random", 2)]
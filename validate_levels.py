@@ -0,0 +1,288 @@
+"""
+Level Validation
+
+Plays every Tiled map in a directory without a window, with a scripted or
+random input policy, and reports for each map how many coins were reached,
+when the last one was collected, whether the player got stuck and how many
+ticks per second the simulation ran at. Maps are spread over a process pool
+so a batch runs about as many times faster as there are cores.
+
+Policies:
+    right         hold RIGHT and jump every JUMP_INTERVAL ticks
+    random        press random keys, changing every HOLD_TICKS ticks
+    script:PATH   play back a recording made with platformer.py --record
+
+Usage:
+    python validate_levels.py levels/ --policy right --policy random --seeds 4
+"""
+
+# type: ignore
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import arcade
+
+from level_cache import LevelCache
+from replay import Recording, apply_event
+from world import COLLISION_DISCRETE, COLLISION_SWEPT, GameWorld
+
+# Constants
+# Map files the runner picks up from a directory
+MAP_EXTENSIONS = (".json", ".tmx", ".plvl")
+
+# A run ends after this many ticks even if coins are left, one minute of play at 60 ticks per second
+MAX_TICKS = 3600
+
+# The player is stuck when it moved less than STUCK_DISTANCE pixels in STUCK_TICKS ticks
+STUCK_TICKS = 300
+STUCK_DISTANCE = 16
+
+JUMP_INTERVAL = 45
+HOLD_TICKS = 20
+
+# Policies that play differently with every seed, the others are run once per map whatever --seeds is
+SEEDED_POLICIES = ("random",)
+
+
+class HeldKeysPolicy:
+    """
+    Holds the keys a function picks for each tick. Only the keys that
+    changed reach the world, like a real keyboard.
+    """
+
+    # Ticks the policy has input for, None when it can play forever
+    length = None
+
+    def __init__(self, choose_keys):
+        # Called as choose_keys(world, tick) for the set of keys held during that tick
+        self.choose_keys = choose_keys
+        self.held = set()
+
+    def apply(self, world, tick):
+        """Press and release keys before a tick's step"""
+
+        keys = self.choose_keys(world, tick)
+        for key in self.held - keys:
+            world.on_key_release(key)
+        for key in keys - self.held:
+            world.on_key_press(key)
+        # UP is ignored in the air, it has to be pressed again once landed
+        if arcade.key.UP in keys and not world.up_pressed:
+            keys = keys - {arcade.key.UP}
+        self.held = set(keys)
+
+
+def run_right_keys(world, tick):
+    """Holds RIGHT and taps UP every JUMP_INTERVAL ticks"""
+    if tick % JUMP_INTERVAL < JUMP_INTERVAL // 2:
+        return {arcade.key.RIGHT, arcade.key.UP}
+    return {arcade.key.RIGHT}
+
+
+class RandomKeys:
+    """
+    Holds a random set of keys, picking a new one every HOLD_TICKS ticks.
+    Moving right is more likely than left so runs tend to cross the level.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.choice = set()
+
+    def __call__(self, world, tick):
+        if tick % HOLD_TICKS == 0:
+            choice = set()
+            direction = self.random.random()
+            if direction < 0.6:
+                choice.add(arcade.key.RIGHT)
+            elif direction < 0.85:
+                choice.add(arcade.key.LEFT)
+            if self.random.random() < 0.4:
+                choice.add(arcade.key.UP)
+            self.choice = choice
+        return self.choice
+
+
+class ScriptPolicy:
+    """
+    Plays a recording's key events on the ticks they were recorded on,
+    exactly as replay.py does: one press or release per event, so an UP
+    pressed in the air is ignored like it was in the game, and ESC restarts.
+    """
+
+    def __init__(self, path):
+        recording = Recording.load(path)
+        self.length = recording.frame_count
+        # Maps a tick to its (pressed, key) events in recorded order
+        self.events = {}
+        for frame, pressed, key in recording.events:
+            self.events.setdefault(frame, []).append((pressed, key))
+
+    def apply(self, world, tick):
+        """Feed in the events recorded before a tick's step"""
+        for pressed, key in self.events.get(tick, ()):
+            apply_event(world, pressed, key)
+
+
+def make_policy(spec, seed):
+    """Build a policy from its command line name"""
+
+    if spec == "right":
+        return HeldKeysPolicy(run_right_keys)
+    if spec == "random":
+        return HeldKeysPolicy(RandomKeys(seed))
+    if spec.startswith("script:"):
+        return ScriptPolicy(spec[len("script:"):])
+    raise ValueError(f"unknown policy {spec!r}, expected right, random or script:PATH")
+
+
+def find_maps(directory):
+    """Every map file directly inside a directory, sorted by name"""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.endswith(MAP_EXTENSIONS))
+
+
+# Each worker process keeps its own parsed levels, so a map played by several
+# policies or seeds is only loaded once per process
+_level_cache = None
+
+
+def simulate(map_path, policy_spec, seed=0, max_ticks=MAX_TICKS, collision=COLLISION_DISCRETE):
+    """Play one map with one policy and return a result dict"""
+
+    global _level_cache
+    if _level_cache is None:
+        _level_cache = LevelCache()
+
+    result = {"map": map_path, "policy": policy_spec, "seed": seed}
+
+    try:
+        world = GameWorld(map_path=map_path, level_cache=_level_cache, collision=collision)
+        world.setup()
+        policy = make_policy(policy_spec, seed)
+    except Exception as error:
+        # A map that cannot be played is a result too, the batch goes on
+        result["error"] = f"{type(error).__name__}: {error}"
+        return result
+
+    coins_total = len(world.scene["Coins"]) if "Coins" in world.scene else 0
+    completion_tick = None
+    stuck = False
+
+    # A recording ends where it ends
+    if policy.length is not None:
+        max_ticks = min(max_ticks, policy.length)
+
+    window_start = world.player_sprite.position
+    window_tick = 0
+
+    # Counted here rather than read from the world, a scripted ESC restarts world.tick
+    tick = 0
+
+    start = time.perf_counter()
+    while tick < max_ticks:
+        policy.apply(world, tick)
+
+        world.step()
+        world.events.clear()
+        tick += 1
+
+        if coins_total and world.score >= coins_total:
+            completion_tick = tick
+            break
+
+        # Stuck when the player stayed in a small area for STUCK_TICKS ticks
+        x, y = world.player_sprite.position
+        if abs(x - window_start[0]) > STUCK_DISTANCE or abs(y - window_start[1]) > STUCK_DISTANCE:
+            window_start = (x, y)
+            window_tick = tick
+        elif tick - window_tick >= STUCK_TICKS:
+            stuck = True
+            break
+    elapsed = time.perf_counter() - start
+
+    # Keys a recording pressed after its last step still changed the player's speed
+    if tick == policy.length:
+        policy.apply(world, tick)
+
+    result.update({
+        "coins_total": coins_total,
+        "coins_reached": world.score,
+        "completed": completion_tick is not None,
+        "completion_ticks": completion_tick,
+        "completion_seconds": completion_tick * world.timestep if completion_tick is not None else None,
+        "stuck": stuck,
+        "ticks": tick,
+        "ticks_per_second": tick / elapsed if elapsed > 0 else float("inf"),
+        "state_hash": world.state_hash().hex(),
+    })
+    return result
+
+
+def _simulate_task(task):
+    return simulate(*task)
+
+
+def run_batch(map_paths, policy_specs, seeds=1, max_ticks=MAX_TICKS, workers=None, collision=COLLISION_DISCRETE):
+    """Play every map with every policy and seed across a process pool, results come back in task order"""
+
+    # A policy that ignores its seed would only play the same run again
+    tasks = [(map_path, spec, seed, max_ticks, collision)
+             for map_path in map_paths for spec in policy_specs
+             for seed in (range(seeds) if spec in SEEDED_POLICIES else [0])]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [_simulate_task(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Small chunks keep the workers busy when some maps end early
+        return list(executor.map(_simulate_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+
+def main():
+    """Validate a directory of maps"""
+    parser = argparse.ArgumentParser(description="Play a directory of maps headless and check they can be completed")
+    parser.add_argument("directory", help="directory of Tiled maps")
+    parser.add_argument("--policy", action="append", help="right, random or script:PATH, may be given more than once")
+    parser.add_argument("--seeds", type=int, default=1, help="runs per map of the random policy, each with its own seed")
+    parser.add_argument("--max-ticks", type=int, default=MAX_TICKS, help="ticks before a run gives up")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, defaults to the number of cores")
+    parser.add_argument("--collision", choices=[COLLISION_DISCRETE, COLLISION_SWEPT], default=COLLISION_DISCRETE,
+                        help="swept collision is faster and never lets the player pass through platforms")
+    parser.add_argument("--json", metavar="PATH", help="also write every result to a JSON file")
+    args = parser.parse_args()
+
+    map_paths = find_maps(args.directory)
+    policy_specs = args.policy or ["right"]
+
+    start = time.perf_counter()
+    results = run_batch(map_paths, policy_specs, args.seeds, args.max_ticks, args.workers, args.collision)
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        name = os.path.basename(result["map"])
+        if "error" in result:
+            print(f"{name:<24} {result['policy']:<10} seed {result['seed']}  error: {result['error']}")
+            continue
+        if result["completed"]:
+            outcome = f"completed in {result['completion_seconds']:.1f} s"
+        elif result["stuck"]:
+            outcome = "stuck"
+        else:
+            outcome = "out of time"
+        print(f"{name:<24} {result['policy']:<10} seed {result['seed']}  "
+              f"coins {result['coins_reached']}/{result['coins_total']}  {outcome}  {result['ticks_per_second']:.0f} ticks/s")
+
+    total_ticks = sum(result.get("ticks", 0) for result in results)
+    print(f"{len(results)} runs, {total_ticks} ticks in {elapsed:.1f} s, {total_ticks / elapsed:.0f} ticks/s overall")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
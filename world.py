@@ -0,0 +1,355 @@
+"""
+Platformer World
+
+Window-free game simulation. Everything that decides what happens in the game
+(physics, coin pickups, camera follow and turning key presses into speeds)
+lives here so it can be stepped without a GL context. GameView in
+platformer.py only draws what the world says.
+"""
+
+# type: ignore
+import argparse
+import hashlib
+import struct
+import time
+
+import arcade
+
+from enemies import EnemySystem
+from level_cache import LevelCache
+from profiling import Profiler
+from snapshots import WorldSnapshot
+from swept_physics import SweptPhysicsEngine
+
+# Constants
+MAP_PATH = ":resources:tiled_maps/map2_level_1.json"
+PLAYER_TEXTURE_PATH = "./Sprites/Pink_Monster/Pink_Monster.png"
+
+PLAYER_MOVEMENT_SPEED = 5
+TILE_SCALING = 0.5
+COIN_SCALING = 0.5
+
+# Constant for gravity based 2D games
+GRAVITY = 1
+PLAYER_JUMP_SPEED = 20
+
+# Per layer options passed to arcade.load_tilemap(), the collectible keys are read by collectibles.py
+LAYER_OPTIONS = {
+    "Platforms": {
+        "use_spatial_hash": True
+    },
+    "Coins": {
+        "collectible": True,
+        "collectible_cell_size": 128
+    }
+}
+
+# Where the player starts on every setup
+PLAYER_START_X = 64
+PLAYER_START_Y = 128
+
+# The speeds and gravity above are per step at BASE_TICK_RATE steps per second
+# A world stepped at another rate scales them so the game plays at the same speed
+BASE_TICK_RATE = 60
+TICK_RATE = 60
+
+# Names of the events the world reports back to whoever is stepping it
+EVENT_JUMP = "jump"
+EVENT_COIN = "coin"
+
+# How the player collides with platforms and coins
+# discrete moves a whole step and then resolves overlaps, like arcade's engine does
+# swept stops at the first platform crossed and collects every coin passed over, at any speed
+COLLISION_DISCRETE = "discrete"
+COLLISION_SWEPT = "swept"
+
+
+class GameWorld:
+    """
+    Game state and rules without a window.
+    """
+
+    def __init__(self, map_path=MAP_PATH, player_texture_path=PLAYER_TEXTURE_PATH, level_cache=None, profiler=None,
+                 collision=COLLISION_DISCRETE, tick_rate=TICK_RATE):
+
+        self.map_path = map_path
+        self.player_texture_path = player_texture_path
+        self.collision = collision
+
+        # Steps per second and the length of one step, a faster rate takes smaller steps
+        self.tick_rate = tick_rate
+        self.timestep = 1 / tick_rate
+
+        # Speeds are per step and gravity is per step per step, so they scale by the ratio once and twice
+        scale = BASE_TICK_RATE / tick_rate
+        self.movement_speed = PLAYER_MOVEMENT_SPEED * scale
+        self.jump_speed = PLAYER_JUMP_SPEED * scale
+        self.gravity = GRAVITY * scale * scale
+        self.speed_scale = scale
+
+        # Parsed levels and textures kept between restarts
+        self.level_cache = level_cache if level_cache is not None else LevelCache()
+
+        # Times the stages of a step, off unless someone turns it on
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
+
+        # Creates empty variables for sprites and sprites lists to be setup each time game starts
+        self.player_texture = None
+
+        self.player_sprite = None
+
+        self.scene = None
+
+        self.tile_map = None
+
+        # The CachedLevel or StreamedLevel being played
+        self.level = None
+
+        # Maps a pickup layer name to its CollectibleIndex
+        self.collectibles = {}
+
+        # Every enemy in the level, moved together each step
+        self.enemies = None
+
+        self.physics_engine = None
+
+        self.score = 0
+
+        # Position the camera should be centered on, the view copies it into its camera
+        self.camera_position = (0, 0)
+
+        # Number of fixed steps taken since the last setup
+        self.tick = 0
+
+        # Things that happened since the last call to pop_events(), for sounds and text
+        self.events = []
+
+        # Creates variables the current state of what key is pressed with the default being false
+        self.left_pressed = False
+        self.right_pressed = False
+        self.up_pressed = False
+        self.down_pressed = False
+
+    def setup(self):
+        """Set up the world here. Call this function to restart the game."""
+
+        # Loads in map for game play, only the first setup parses the map and a restart puts the coins back
+        level = self.level_cache.load_level(self.map_path, TILE_SCALING, LAYER_OPTIONS)
+
+        self.level = level
+
+        self.tile_map = level.tile_map
+
+        self.scene = level.scene
+
+        # Grids over the pickup layers so a step only checks coins near the player
+        self.collectibles = level.collectibles
+
+        # Enemies start at the points of the map's "Enemies" object layer, if it has one
+        self.enemies = EnemySystem(level.platform_grid, self.gravity, self.speed_scale)
+        self.enemies.spawn_from_objects(self.tile_map.object_lists.get("Enemies"))
+
+        # Loads in a texture to assign to player_texture, kept by the cache after the first load
+        self.player_texture = self.level_cache.load_texture(self.player_texture_path)
+
+        # Uses player_texture and assigns a player sprite using Arcades Sprite() method
+        self.player_sprite = arcade.Sprite(self.player_texture)
+        # Assigns player_sprite a coordinate on game window
+        self.player_sprite.center_x = PLAYER_START_X
+        self.player_sprite.center_y = PLAYER_START_Y
+        # Add player sprite to scene, replacing the player from before a restart
+        if "Player" in self.scene:
+            self.scene.remove_sprite_list_by_name("Player")
+        self.scene.add_sprite("Player", self.player_sprite)
+
+        # A streamed level loads the chunks around the start before the physics engine looks at the platforms
+        self.level.stream(self.player_sprite.position)
+
+        # arcade's engine collides against sprites, which platforms kept as arrays do not have,
+        # so a level with static Platforms is always swept
+        self.level_collision = COLLISION_SWEPT if "Platforms" in level.static_layers else self.collision
+
+        # Uses Arcades built in platformer physics engine
+        # Sets parameter gravity_constant to GRAVITY, scaled to the tick rate
+        if self.level_collision == COLLISION_SWEPT:
+            # Sweeps against the platform grid, which only holds the whole level when it is fully loaded
+            if level.streamed:
+                raise ValueError("swept collision needs a fully loaded level, not a streamed one")
+            self.physics_engine = SweptPhysicsEngine(self.player_sprite, level.platform_grid, self.gravity)
+        else:
+            # The list is wrapped because arcade skips an empty SpriteList, and a streamed level's
+            # shared "Platforms" list can be empty now and filled by chunks later
+            self.physics_engine = arcade.PhysicsEnginePlatformer(self.player_sprite, walls=[self.scene["Platforms"]],
+                                                                 gravity_constant=self.gravity)
+
+        # Resets score, keys and the step counter
+        self.score = 0
+        self.tick = 0
+        self.events = []
+        self.left_pressed = False
+        self.right_pressed = False
+        self.up_pressed = False
+        self.down_pressed = False
+
+        self.camera_position = self.player_sprite.position
+
+    def step(self):
+        """Advance the world by one fixed timestep"""
+
+        profiler = self.profiler
+
+        # Streamed levels load and drop chunks around the player
+        with profiler.zone("world.stream"):
+            self.level.stream(self.player_sprite.position)
+
+        # Moves the player one step in regards to the platformer physics engine
+        with profiler.zone("world.physics"):
+            self.physics_engine.update()
+
+        # Moves every enemy at once
+        with profiler.zone("world.enemies"):
+            self.enemies.update()
+
+        # Checks for collision betweeen player sprite and the coins in the grid cells it overlaps
+        # Any coin hit is removed from the grid and the scene
+        with profiler.zone("world.coins"):
+            if "Coins" not in self.collectibles:
+                coin_hit_list = []
+            elif self.level_collision == COLLISION_SWEPT:
+                # Everything the player passed over this step, not just where it ended up
+                coin_hit_list = self.collectibles["Coins"].collect_boxes(self.physics_engine.swept_boxes)
+            else:
+                coin_hit_list = self.collectibles["Coins"].collect(self.player_sprite)
+
+        for coin in coin_hit_list:
+            # Updates the score to plus one
+            self.score += 1
+            self.events.append(EVENT_COIN)
+
+        # Camera follows the player sprite
+        self.camera_position = self.player_sprite.position
+
+        self.tick += 1
+
+    def run(self, frames):
+        """Step the world frames times as fast as possible and return the steps per second"""
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            self.step()
+        elapsed = time.perf_counter() - start
+
+        # Nobody is listening for sounds in a headless run
+        self.events.clear()
+
+        if elapsed == 0:
+            return float("inf")
+        return frames / elapsed
+
+    def state_hash(self):
+        """SHA-1 of the player, score, tick, remaining coins and enemies, equal hashes mean equal worlds"""
+
+        digest = hashlib.sha1()
+        player = self.player_sprite
+        digest.update(struct.pack("<4d2q", player.center_x, player.center_y, player.change_x, player.change_y, self.score, self.tick))
+        for coin in self.scene["Coins"] if "Coins" in self.scene else ():
+            digest.update(struct.pack("<2d", coin.center_x, coin.center_y))
+        for array in (self.enemies.x, self.enemies.y, self.enemies.change_x, self.enemies.change_y):
+            digest.update(array.tobytes())
+        return digest.digest()
+
+    def snapshot(self):
+        """Copy of the state that changes during play, see snapshots.py"""
+        return WorldSnapshot.capture(self)
+
+    def restore(self, snapshot):
+        """Go back to a snapshot taken on the current level, without loading anything"""
+        snapshot.restore(self)
+
+    def pop_events(self):
+        """Return and clear the events since the last call"""
+
+        events = self.events
+        self.events = []
+        return events
+
+    def update_player_speed(self):
+
+        # Calculate speed based on the keys pressed
+        self.player_sprite.change_x = 0
+        self.player_sprite.change_y = 0
+
+        # If up_pressed is TRUE AND down_pressed is FALSE, the player jumps at PLAYER_JUMP_SPEED
+        if self.up_pressed and not self.down_pressed:
+            self.player_sprite.change_y = self.jump_speed
+        # If down_pressed is TRUE AND up_pressed is FALSE, the y coordinate decreased by PLAYER_MOVEMENT_SPEED(5)
+        elif self.down_pressed and not self.up_pressed:
+            self.player_sprite.change_y = -self.movement_speed
+        # If left_pressed is TRUE AND right_pressed is FALSE, the x coordinate decreases by PLAYER_MOVEMENT_SPEED(5)
+        if self.left_pressed and not self.right_pressed:
+            self.player_sprite.change_x = -self.movement_speed
+        # If right_pressed is TRUE AND left_pressed is FALSE, the x coordinate increases by PLAYER_MOVEMENT_SPEED(5)
+        elif self.right_pressed and not self.left_pressed:
+            self.player_sprite.change_x = self.movement_speed
+
+    def on_key_press(self, key):
+        """Update key state for a pressed key"""
+
+        # UP only counts while the player sprite is touching the ground
+        if key == arcade.key.UP:
+            if self.physics_engine.can_jump():
+                self.up_pressed = True
+                self.update_player_speed()
+                self.events.append(EVENT_JUMP)
+        elif key == arcade.key.DOWN:
+            self.down_pressed = True
+            self.update_player_speed()
+        elif key == arcade.key.LEFT:
+            self.left_pressed = True
+            self.update_player_speed()
+        elif key == arcade.key.RIGHT:
+            self.right_pressed = True
+            self.update_player_speed()
+
+    def on_key_release(self, key):
+        """Update key state for a released key"""
+
+        if key == arcade.key.UP:
+            self.up_pressed = False
+            self.update_player_speed()
+        elif key == arcade.key.DOWN:
+            self.down_pressed = False
+            self.update_player_speed()
+        elif key == arcade.key.LEFT:
+            self.left_pressed = False
+            self.update_player_speed()
+        elif key == arcade.key.RIGHT:
+            self.right_pressed = False
+            self.update_player_speed()
+
+
+def main():
+    """Run the world headless and print how fast it steps"""
+    parser = argparse.ArgumentParser(description="Step the platformer world without a window")
+    parser.add_argument("--frames", type=int, default=10000, help="number of fixed steps to run")
+    parser.add_argument("--map", default=MAP_PATH, help="Tiled map to load")
+    parser.add_argument("--profile", metavar="PATH", help="write per stage timings to a .csv or .json file")
+    parser.add_argument("--collision", choices=[COLLISION_DISCRETE, COLLISION_SWEPT], default=COLLISION_DISCRETE,
+                        help="how the player collides with platforms and coins")
+    parser.add_argument("--tick-rate", type=int, default=TICK_RATE, help="simulation steps per second of game time")
+    args = parser.parse_args()
+
+    world = GameWorld(map_path=args.map, profiler=Profiler(enabled=args.profile is not None), collision=args.collision,
+                      tick_rate=args.tick_rate)
+    world.setup()
+    steps_per_second = world.run(args.frames)
+    print(f"{args.frames} steps, {steps_per_second:.0f} steps/s, score {world.score}")
+
+    if args.profile:
+        world.profiler.export(args.profile)
+        for row in world.profiler.summary():
+            print(f"{row['zone']:<16} p50 {row['p50_ms']:.3f} ms  p95 {row['p95_ms']:.3f} ms  p99 {row['p99_ms']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()